@@ -1,6 +1,9 @@
-from fastapi import APIRouter
+import json
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.rag.engine import ingest_docs, retrieve_docs
+from app.rag.engine import retrieve_docs
+from app.core.concurrency import run_cpu
 
 router = APIRouter(prefix="/rag", tags=["RAG"])
 
@@ -8,31 +11,85 @@ class RetrieveRequest(BaseModel):
     query: str
     k: int = 3
 
-@router.post("/ingest")
-def ingest_endpoint():
-    # We could capture stdout here but for now let's just use the stats
-    stats = ingest_docs()
-    return {"status": "success", "stats": stats}
+@router.post("/ingest", status_code=202)
+def ingest_endpoint(force: bool = False):
+    """Queues a background ingestion job; poll /rag/ingest/{job_id} for progress."""
+    from app.rag.jobs import ingest_jobs
+    job = ingest_jobs.submit(force=force)
+    return {"status": "accepted", "job_id": job.id, "job": job.to_dict()}
+
+@router.get("/ingest")
+def list_ingest_jobs():
+    from app.rag.jobs import ingest_jobs
+    return {"jobs": ingest_jobs.list()}
+
+@router.get("/ingest/{job_id}")
+def ingest_status(job_id: str):
+    from app.rag.jobs import ingest_jobs
+    job = ingest_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job.to_dict()
 
 @router.post("/retrieve")
-def retrieve_endpoint(request: RetrieveRequest):
-    results = retrieve_docs(request.query, request.k)
+async def retrieve_endpoint(request: RetrieveRequest):
+    results = await run_cpu(retrieve_docs, request.query, request.k)
     return {"results": results}
 
 class AskRequest(BaseModel):
     query: str
+    include_trace: bool = False  # attach per-stage spans to the response
 
 @router.post("/ask")
-def ask_endpoint(request: AskRequest):
-    from app.rag.llm import generate_answer
-    result = generate_answer(request.query)
+async def ask_endpoint(request: AskRequest):
+    from app.rag.llm import agenerate_answer
+    result = await agenerate_answer(request.query, include_trace=request.include_trace)
     return result
 
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/ask/stream")
+async def ask_stream_endpoint(request: AskRequest):
+    """Server-Sent Events: 'sources' first, then 'token' events, then 'done' (or 'error')."""
+    from app.rag.llm import astream_answer
+
+    async def event_source():
+        async for event, data in astream_answer(request.query, include_trace=request.include_trace):
+            yield format_sse(event, data)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the client as they are produced
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/metrics")
 def get_metrics():
     from app.core.metrics import metrics
     return metrics.get_metrics()
 
+@router.get("/traces")
+def list_traces(limit: int = 50):
+    """Most recent finished /ask traces (newest first), without spans."""
+    from app.core.tracing import traces
+    return {"buffered": len(traces), "traces": [t.to_dict(spans=False) for t in traces.recent(limit)]}
+
+@router.get("/traces/slow")
+def slow_traces(limit: int = 20, percentile: float = 0.95):
+    """Slowest buffered traces with spans, and mean per-stage time across the tail above `percentile`."""
+    from app.core.tracing import traces
+    return traces.slowest(limit, percentile)
+
+@router.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    from app.core.tracing import traces
+    trace = traces.get(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found (expired from the buffer or never finished)")
+    return trace.to_dict()
+
 @router.get("/debug_count")
 def debug_count():
     from app.rag.engine import get_collection
@@ -0,0 +1,21 @@
+import os
+import asyncio
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded pool for CPU-bound RAG work (query embedding, BM25 scoring, Chroma queries).
+# Keeping it separate from FastAPI's default threadpool means slow LLM waits, which are
+# awaited on the event loop, can never starve retrieval and vice versa.
+CPU_WORKERS = int(os.getenv("RAG_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="rag-cpu")
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Runs a blocking, CPU-bound call on the bounded executor and awaits the result.
+    The caller's contextvars (e.g. the current trace) are visible inside `func`.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(cpu_executor, partial(ctx.run, func, *args, **kwargs))
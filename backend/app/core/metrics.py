@@ -1,35 +1,191 @@
 import os
 import time
-from typing import Dict, List
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Rolling window for percentiles and rates, kept as a ring of fixed-size time slots
+METRICS_WINDOW_SECONDS = float(os.getenv("METRICS_WINDOW_SECONDS", "300"))
+METRICS_WINDOW_SLOTS = int(os.getenv("METRICS_WINDOW_SLOTS", "30"))
+
+# Latency bucket upper bounds in seconds: 1-1.5-2-3-5-7 per decade, 1ms .. 100s.
+# Percentiles are interpolated inside a bucket, so they are estimates, not exact values.
+LATENCY_BUCKETS = tuple(
+    round(m * 10 ** e, 6) for e in range(-3, 2) for m in (1, 1.5, 2, 3, 5, 7)
+) + (100.0,)
+
+
+class RollingHistogram:
+    """
+    Fixed-memory latency histogram (values in seconds).
+
+    Keeps cumulative bucket counts since start (for exposition formats) plus one bucket
+    array per time slot in a ring covering the rolling window, from which windowed
+    percentiles and rates are computed. Memory is O(buckets * slots) regardless of uptime;
+    each observe is a bisect plus a few increments under the histogram's own lock.
+    """
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS, window: float = METRICS_WINDOW_SECONDS,
+                 slots: int = METRICS_WINDOW_SLOTS):
+        self.bounds = bounds
+        self.window = window
+        self.slot_seconds = window / slots
+        self.created = time.monotonic()
+        n = len(bounds) + 1  # last bucket is +Inf
+        self._slots = [[0] * n for _ in range(slots)]
+        self._slot_ids = [-1] * slots  # absolute slot number held by each ring entry
+        self._slot_sums = [0.0] * slots
+        self.buckets = [0] * n
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        bucket = bisect_left(self.bounds, value)
+        slot_id = int(time.monotonic() // self.slot_seconds)
+        ring = slot_id % len(self._slots)
+        with self._lock:
+            if self._slot_ids[ring] != slot_id:
+                self._slots[ring] = [0] * len(self.buckets)
+                self._slot_ids[ring] = slot_id
+                self._slot_sums[ring] = 0.0
+            self._slots[ring][bucket] += 1
+            self._slot_sums[ring] += value
+            self.buckets[bucket] += 1
+            self.count += 1
+            self.sum += value
+
+    def window_counts(self) -> Tuple[List[int], int, float]:
+        """(bucket counts, count, sum) over the rolling window."""
+        oldest = int(time.monotonic() // self.slot_seconds) - len(self._slots) + 1
+        counts = [0] * len(self.buckets)
+        total = 0.0
+        with self._lock:
+            for slot, slot_id, slot_sum in zip(self._slots, self._slot_ids, self._slot_sums):
+                if slot_id >= oldest:
+                    counts = [a + b for a, b in zip(counts, slot)]
+                    total += slot_sum
+        return counts, sum(counts), total
+
+    def cumulative(self) -> Tuple[List[int], int, float]:
+        """(cumulative counts per bound incl. +Inf, count, sum) since start."""
+        with self._lock:
+            buckets, count, total = list(self.buckets), self.count, self.sum
+        running = 0
+        cumulative = []
+        for c in buckets:
+            running += c
+            cumulative.append(running)
+        return cumulative, count, total
+
+    def percentile(self, counts: List[int], n: int, q: float) -> float:
+        if not n:
+            return 0.0
+        rank = q * n
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+    def summary(self) -> Dict:
+        counts, n, total = self.window_counts()
+        elapsed = min(self.window, max(time.monotonic() - self.created, 1e-9))
+        return {
+            "count": n,
+            "rate_per_sec": round(n / elapsed, 4),
+            "avg_ms": round(total / n * 1000, 2) if n else 0,
+            "p50_ms": round(self.percentile(counts, n, 0.50) * 1000, 2),
+            "p95_ms": round(self.percentile(counts, n, 0.95) * 1000, 2),
+            "p99_ms": round(self.percentile(counts, n, 0.99) * 1000, 2),
+            "total_count": self.count
+        }
+
 
 class MetricsManager:
     def __init__(self):
         self.start_time = time.time()
+        self._lock = threading.Lock()
         self.total_requests = 0
         self.success_count = 0
         self.low_context_count = 0
         self.error_count = 0
         self.total_latency = 0.0
-        self.top_scores = []
+        # Running sum instead of a list of every score - constant memory
+        self.top_score_sum = 0.0
+        self.top_score_count = 0
+        self.latency = RollingHistogram()  # end-to-end /ask latency, all statuses
+        self.latency_by_status = {}  # status -> RollingHistogram
+        self.stages = {}  # pipeline stage -> RollingHistogram
+        # HTTP middleware series, labelled by route template (bounded by the route table)
+        self.http_requests = {}  # (method, route, status code) -> count
+        self.http_latency = {}  # (method, route) -> RollingHistogram
+        self.counters = {}  # name -> monotonically increasing total
+        self.caches = {}
+        self.components = {}
+
+    def register_cache(self, name: str, cache):
+        """Registers any object with a stats() -> dict method to be reported under 'caches'."""
+        self.caches[name] = cache
+
+    def register_component(self, name: str, component):
+        """Like register_cache, for non-cache components (reported under 'components')."""
+        self.components[name] = component
+
+    def _histogram(self, table: Dict, name: str) -> RollingHistogram:
+        hist = table.get(name)
+        if hist is None:
+            with self._lock:
+                hist = table.setdefault(name, RollingHistogram())
+        return hist
 
     def log_request(self, status: str, latency: float, top_score: float = None):
-        self.total_requests += 1
-        self.total_latency += latency
-        
-        if status == "success":
-            self.success_count += 1
-        elif status == "low_context":
-            self.low_context_count += 1
-        else:
-            self.error_count += 1
-            
-        if top_score is not None:
-            self.top_scores.append(top_score)
+        with self._lock:
+            self.total_requests += 1
+            self.total_latency += latency
+
+            if status == "success":
+                self.success_count += 1
+            elif status == "low_context":
+                self.low_context_count += 1
+            else:
+                self.error_count += 1
+
+            if top_score is not None:
+                self.top_score_sum += top_score
+                self.top_score_count += 1
+
+        self.latency.observe(latency)
+        self._histogram(self.latency_by_status, status).observe(latency)
+
+    def observe(self, stage: str, seconds: float):
+        """Records one pipeline stage duration (e.g. 'vector', 'bm25', 'llm')."""
+        self._histogram(self.stages, stage).observe(seconds)
+
+    def observe_timings(self, timings: Dict):
+        """Records every '<stage>_ms' entry of a timings dict (as filled by hybrid_retrieve_docs)."""
+        for key, value in timings.items():
+            if key.endswith("_ms") and value is not None:
+                self.observe(key[:-3], value / 1000)
+
+    def log_http(self, method: str, route: str, status_code: int, seconds: float):
+        """Records one HTTP request; `route` must be a route template, never a raw path."""
+        key = (method, route, str(status_code))
+        with self._lock:
+            self.http_requests[key] = self.http_requests.get(key, 0) + 1
+        self._histogram(self.http_latency, (method, route)).observe(seconds)
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
 
     def get_metrics(self) -> Dict:
         avg_latency = self.total_latency / self.total_requests if self.total_requests > 0 else 0
-        avg_top_score = sum(self.top_scores) / len(self.top_scores) if self.top_scores else 0
-        
+        avg_top_score = self.top_score_sum / self.top_score_count if self.top_score_count else 0
+
         return {
             "uptime_seconds": int(time.time() - self.start_time),
             "total_requests": self.total_requests,
@@ -42,7 +198,15 @@ class MetricsManager:
                 "success": self.success_count,
                 "low_context": self.low_context_count,
                 "error": self.error_count
-            }
+            },
+            "window_seconds": METRICS_WINDOW_SECONDS,
+            "latency": self.latency.summary(),
+            "latency_by_status": {status: h.summary() for status, h in list(self.latency_by_status.items())},
+            "stages": {stage: h.summary() for stage, h in list(self.stages.items())},
+            "http": {f"{method} {route}": h.summary() for (method, route), h in list(self.http_latency.items())},
+            "counters": dict(self.counters),
+            "caches": {name: cache.stats() for name, cache in self.caches.items()},
+            "components": {name: c.stats() for name, c in self.components.items()}
         }
 
 metrics = MetricsManager()
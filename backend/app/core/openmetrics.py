@@ -0,0 +1,151 @@
+import math
+import time
+from typing import Dict, List, Tuple
+from app.core.metrics import metrics, RollingHistogram
+
+# Content types for GET /metrics. OpenMetrics is sent when the scraper asks for it
+# (Prometheus does by default); anything else gets the classic text format 0.0.4.
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Cache stats exported as counters vs gauges (other keys are configuration, not series)
+_CACHE_COUNTERS = ("hits", "misses", "evictions", "invalidations")
+_CACHE_GAUGES = ("size",)
+
+# LLM client stats (see LLMClient.stats)
+_LLM_COUNTERS = ("requests", "retries", "rate_limited", "failures")
+_LLM_GAUGES = ("in_flight", "queue_depth", "max_in_flight")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class MetricsWriter:
+    """Hand-rendered exposition text; no client library needed for a few dozen families."""
+
+    def __init__(self, openmetrics: bool = True):
+        self.openmetrics = openmetrics
+        self.lines = []
+
+    def _family(self, name: str, kind: str, help_text: str):
+        # OpenMetrics names the counter family without _total; the 0.0.4 format names the sample
+        family = name if (kind != "counter" or self.openmetrics) else f"{name}_total"
+        self.lines.append(f"# HELP {family} {help_text}")
+        self.lines.append(f"# TYPE {family} {kind}")
+
+    def _sample(self, name: str, labels: Dict, value):
+        if labels:
+            rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            self.lines.append(f"{name}{{{rendered}}} {_number(value)}")
+        else:
+            self.lines.append(f"{name} {_number(value)}")
+
+    def counter(self, name: str, help_text: str, samples: List[Tuple[Dict, float]]):
+        self._family(name, "counter", help_text)
+        for labels, value in samples:
+            self._sample(f"{name}_total", labels, value)
+
+    def gauge(self, name: str, help_text: str, samples: List[Tuple[Dict, float]]):
+        self._family(name, "gauge", help_text)
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def histogram(self, name: str, help_text: str, series: List[Tuple[Dict, RollingHistogram]]):
+        self._family(name, "histogram", help_text)
+        for labels, hist in series:
+            cumulative, count, total = hist.cumulative()
+            for bound, c in zip(list(hist.bounds) + [math.inf], cumulative):
+                self._sample(f"{name}_bucket", dict(labels, le=_number(float(bound))), c)
+            self._sample(f"{name}_count", labels, count)
+            self._sample(f"{name}_sum", labels, total)
+
+    def render(self) -> str:
+        if self.openmetrics:
+            self.lines.append("# EOF")
+        return "\n".join(self.lines) + "\n"
+
+
+def _rag_state() -> Dict:
+    """Corpus gauges from the published retrieval snapshot (no Chroma round trip)."""
+    from app.rag.engine import get_snapshot
+    snapshot = get_snapshot()
+    return {
+        "corpus_chunks": snapshot.bm25.corpus_size if snapshot.bm25 is not None else 0,
+        "corpus_version": snapshot.version
+    }
+
+
+def render_metrics(openmetrics: bool = True) -> str:
+    w = MetricsWriter(openmetrics)
+
+    # HTTP (from the log_requests middleware)
+    w.counter("http_requests", "HTTP requests by method, route template and status code.", [
+        ({"method": m, "route": r, "status": s}, n) for (m, r, s), n in sorted(list(metrics.http_requests.items()))
+    ])
+    w.histogram("http_request_duration_seconds", "HTTP request latency by method and route template.", [
+        ({"method": m, "route": r}, h) for (m, r), h in sorted(list(metrics.http_latency.items()))
+    ])
+
+    # RAG answers and pipeline stages
+    w.counter("rag_requests", "Answered /ask requests by outcome.", [
+        ({"status": "success"}, metrics.success_count),
+        ({"status": "low_context"}, metrics.low_context_count),
+        ({"status": "error"}, metrics.error_count)
+    ])
+    w.histogram("rag_request_duration_seconds", "End-to-end answer latency by outcome.", [
+        ({"status": status}, h) for status, h in sorted(list(metrics.latency_by_status.items()))
+    ])
+    w.histogram("rag_stage_duration_seconds",
+                "Pipeline stage latency (embed, retrieval, vector, bm25, fusion, fetch, rerank, llm, llm_first_token).", [
+                    ({"stage": stage}, h) for stage, h in sorted(list(metrics.stages.items()))
+                ])
+
+    # Caches
+    caches = {name: cache.stats() for name, cache in list(metrics.caches.items())}
+    for key in _CACHE_COUNTERS:
+        w.counter(f"rag_cache_{key}", f"Cache {key} by cache.", [
+            ({"cache": name}, stats[key]) for name, stats in sorted(caches.items()) if key in stats
+        ])
+    for key in _CACHE_GAUGES:
+        w.gauge(f"rag_cache_{key}", "Cache entries by cache.", [
+            ({"cache": name}, stats[key]) for name, stats in sorted(caches.items()) if key in stats
+        ])
+
+    # LLM client (queueing, retries)
+    llm = metrics.components.get("llm")
+    if llm is not None:
+        stats = llm.stats()
+        for key in _LLM_COUNTERS:
+            w.counter(f"rag_llm_{key}", f"LLM client {key.replace('_', ' ')}.", [({}, stats[key])])
+        for key in _LLM_GAUGES:
+            w.gauge(f"rag_llm_{key}", f"LLM client {key.replace('_', ' ')}.", [({}, stats[key])])
+
+    # Corpus and ingestion
+    state = _rag_state()
+    w.gauge("rag_corpus_chunks", "Chunks in the published retrieval snapshot.", [({}, state["corpus_chunks"])])
+    w.gauge("rag_corpus_version", "Corpus version (bumped by every ingest that changes the collection).",
+            [({}, state["corpus_version"])])
+    counters = dict(metrics.counters)
+    w.counter("rag_ingest_jobs", "Finished ingestion jobs by outcome.", [
+        ({"status": status}, counters.get(f"ingest_jobs_{status}", 0)) for status in ("completed", "failed")
+    ])
+    w.counter("rag_ingest_chunks_embedded", "Chunks embedded and stored by ingestion.",
+              [({}, counters.get("ingest_chunks_embedded", 0))])
+    w.counter("rag_ingest_docs", "Documents parsed by ingestion.", [({}, counters.get("ingest_docs", 0))])
+    w.counter("rag_ingest_seconds", "Wall time spent in ingestion jobs (rate against chunks for throughput).",
+              [({}, counters.get("ingest_seconds", 0.0))])
+
+    w.gauge("process_uptime_seconds", "Seconds since the metrics manager started.",
+            [({}, int(time.time() - metrics.start_time))])
+    return w.render()
@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# Finished traces kept in memory for /rag/traces (oldest dropped first)
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "1000"))
+
+
+class Trace:
+    """
+    Spans for one request, keyed on its trace_id. A span is (name, start, end) in
+    perf_counter seconds; recording one is two clock reads and a list append, so spans
+    are always on. Spans may be added from pool threads (see run_cpu), list.append is
+    atomic so no lock is needed.
+    """
+
+    def __init__(self, trace_id: str, name: str, **attrs):
+        self.trace_id = trace_id
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = None
+        self.spans = []
+        self._token = None  # contextvar token from start_trace, reset by finish_trace
+
+    def add_span(self, name: str, start: float, end: float):
+        self.spans.append((name, start, end))
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def to_dict(self, spans: bool = True) -> Dict:
+        data = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 2),
+            **self.attrs
+        }
+        if spans:
+            data["spans"] = [
+                {
+                    "name": name,
+                    "offset_ms": round((start - self.start) * 1000, 2),
+                    "duration_ms": round((end - start) * 1000, 2)
+                }
+                for name, start, end in sorted(self.spans, key=lambda s: s[1])
+            ]
+        return data
+
+
+class TraceStore:
+    """Ring buffer of finished traces."""
+
+    def __init__(self, maxlen: int = TRACE_BUFFER_SIZE):
+        self._traces = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def _all(self) -> List[Trace]:
+        with self._lock:
+            return list(self._traces)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        for trace in reversed(self._all()):
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+    def recent(self, limit: int = 50) -> List[Trace]:
+        return self._all()[-limit:][::-1]
+
+    def slowest(self, limit: int = 20, percentile: float = 0.95) -> Dict:
+        """
+        The `limit` slowest traces, plus the mean time per span name over every trace at
+        or above `percentile` - i.e. where the tail latency actually goes.
+        """
+        traces = sorted(self._all(), key=lambda t: t.duration_ms, reverse=True)
+        if not traces:
+            return {"count": 0, "threshold_ms": 0, "tail_count": 0, "stage_breakdown": {}, "traces": []}
+        tail = traces[:max(1, int(round(len(traces) * (1 - percentile))))]
+        totals = {}
+        for trace in tail:
+            for name, start, end in trace.spans:
+                totals[name] = totals.get(name, 0.0) + (end - start) * 1000
+        return {
+            "count": len(traces),
+            "threshold_ms": round(tail[-1].duration_ms, 2),
+            "tail_count": len(tail),
+            "stage_breakdown": {
+                name: round(total / len(tail), 2)
+                for name, total in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+            },
+            "traces": [t.to_dict() for t in traces[:limit]]
+        }
+
+    def __len__(self):
+        return len(self._traces)
+
+
+traces = TraceStore()
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+
+
+def start_trace(trace_id: str, name: str, **attrs) -> Trace:
+    """
+    Starts a trace and makes it current for this context (and pool work it spawns) until
+    finish_trace, which restores whatever was current before.
+    """
+    trace = Trace(trace_id, name, **attrs)
+    trace._token = _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def finish_trace(trace: Trace, status: str):
+    """
+    Stamps the end time, stores the trace and stops it being current, so later spans on
+    the same thread (sync callers, scripts) are not attached to a finished trace.
+    Idempotent - only the first call counts.
+    """
+    if trace.end is not None:
+        return
+    trace.end = time.perf_counter()
+    trace.status = status
+    traces.add(trace)
+    token, trace._token = trace._token, None
+    if token is not None:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # Finished from another context (e.g. a stream closed by a different task)
+            if _current_trace.get() is trace:
+                _current_trace.set(None)
+
+
+@contextmanager
+def span(name: str):
+    """Records the enclosed block as a span of the current trace (no-op outside a trace)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter())
+
+
+def record_span(name: str, start: float, end: float = None):
+    """Adds an already-measured span (perf_counter timestamps) to the current trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, end if end is not None else time.perf_counter())
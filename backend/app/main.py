@@ -4,10 +4,12 @@ import logging
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from app.db.init_db import init_db
 from app.api import auth, rag
 from app.rag.engine import init_bm25, DATA_DIR, DOCS_DIR, DB_PATH
+from app.core.metrics import metrics
+from app.core.openmetrics import render_metrics, OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,21 +26,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Readiness is separate from liveness: the process is up long before the embedding
+# model is loaded and warm. Orchestrators should route traffic on /ready.
+startup_state = {
+    "ready": False,
+    "stage": "starting",
+    "warmup_seconds": None,
+    "error": None
+}
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "Backend is running"}
+    return {"status": "ok", "message": "Backend is running", "ready": startup_state["ready"], "startup": startup_state}
+
+@app.get("/ready")
+def readiness_check():
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "startup": startup_state})
+    return {"status": "ready", "startup": startup_state}
+
+# Methods outside this set are folded into "OTHER" so they cannot add label values
+_METRIC_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
 
 # Logging Middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
-    response = await call_next(request)
-    latency = (time.time() - start_time) * 1000  # Convert to ms
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.time() - start_time
+        # Label by the matched route template (e.g. /rag/ingest/{job_id}), never the raw
+        # path, so metric cardinality is bounded by the route table
+        route = getattr(request.scope.get("route"), "path", None) or "other"
+        method = request.method if request.method in _METRIC_METHODS else "OTHER"
+        metrics.log_http(method, route, status_code, elapsed)
+    latency = elapsed * 1000  # Convert to ms
     logger.info(
         f"{request.method} {request.url.path} - Status: {response.status_code} - Latency: {latency:.2f}ms"
     )
     return response
 
+@app.get("/metrics")
+def openmetrics_endpoint(request: Request):
+    """Prometheus/OpenMetrics scrape endpoint (the JSON view stays at /rag/metrics)."""
+    openmetrics = "application/openmetrics-text" in request.headers.get("accept", "")
+    return Response(
+        content=render_metrics(openmetrics=openmetrics),
+        media_type=OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+    )
+
 @app.on_event("startup")
 def startup_event():
     import threading
@@ -52,24 +91,38 @@ def startup_event():
                     logger.info(f"Created directory: {path}")
 
             # 2. Initialize DB
+            startup_state["stage"] = "database"
             init_db()
             logger.info("Database initialized successfully.")
 
-            # 3. Check if ingestion is needed (self-healing)
-            from app.rag.engine import get_collection, ingest_docs, init_bm25
+            # 3. Load retrieval state
+            startup_state["stage"] = "retrieval"
+            from app.rag.engine import get_collection, init_retrieval, warmup_retrieval
             col = get_collection()
             
-            # Initialize BM25 with existing data immediately
-            init_bm25()
+            # Initialize BM25, the HNSW index (VECTOR_BACKEND=hnsw; migrates from Chroma on
+            # first start) and exact search for small corpora with existing data immediately.
+            # Waits for an ingest job accepted meanwhile instead of racing it.
+            init_retrieval()
+
+            # 4. Warm up the embedding model and vector index so the first query is fast
+            startup_state["stage"] = "warmup"
+            from app.rag.rerank import warmup_reranker
+            startup_state["warmup_seconds"] = round(warmup_retrieval() + warmup_reranker(), 2)
+            logger.info(f"Retrieval warm in {startup_state['warmup_seconds']}s.")
+            startup_state["ready"] = True
+            startup_state["stage"] = "ready"
             
+            # 5. Check if ingestion is needed (self-healing)
             if col.count() == 0:
-                logger.info("Vector DB is empty. Starting background auto-ingestion...")
-                stats = ingest_docs()
-                logger.info(f"Background auto-ingestion complete: {stats}")
+                from app.rag.jobs import ingest_jobs
+                job = ingest_jobs.submit()
+                logger.info(f"Vector DB is empty. Queued auto-ingestion job {job.id}.")
             else:
                 logger.info(f"Vector DB already has {col.count()} chunks.")
                 
         except Exception as e:
+            startup_state["error"] = str(e)
             logger.error(f"Failed during background startup: {e}")
 
     # Kick off the startup logic in a thread so API becomes ready immediately
@@ -0,0 +1,86 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-query encode calls into batched model calls.
+
+    Callers block on encode(text) while one worker thread drains the queue: it takes
+    every request already waiting (up to max_batch), optionally lingers max_wait_ms for
+    more, encodes them in one forward pass and hands each caller its own vector.
+    With max_wait_ms=0 a lone request is encoded immediately, so low-load latency is
+    unchanged; under load, requests that arrive while a batch is being encoded form
+    the next batch.
+    """
+
+    def __init__(self, encode_fn, max_batch: int = 32, max_wait_ms: float = 0.0):
+        self._encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+
+    def encode(self, text: str):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._worker.start()
+
+    def _collect(self):
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch:
+            try:
+                items.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            texts = [text for text, _ in items]
+            try:
+                vectors = self._encode_fn(texts)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            self.max_seen_batch = max(self.max_seen_batch, len(items))
+            for (_, future), vector in zip(items, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "max_seen_batch": self.max_seen_batch,
+            "queue_depth": self._queue.qsize()
+        }
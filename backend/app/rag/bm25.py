@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import shutil
+from collections import Counter
+from functools import lru_cache
+from typing import List, Tuple, Sequence
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# On-disk format version - bump if the files written by BM25Index.save change
+INDEX_FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens. Shared by the corpus and queries so both sides agree."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+@lru_cache(maxsize=4096)
+def tokenize_query(query: str) -> Tuple[str, ...]:
+    return tuple(tokenize(query))
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index (same scoring as rank_bm25.BM25Okapi).
+
+    Postings are stored CSR-style: for term t, post_docs[indptr[t]:indptr[t+1]] are the
+    documents containing t, post_tfs their term frequencies and post_weights the
+    precomputed length-normalized tf part of the BM25 formula. Scoring a query only
+    touches the postings of its terms instead of every document in the corpus.
+
+    The index never holds chunk text - only chunk ids - and can be saved to a directory
+    of .npy files that are memory-mapped on load. Updates (`updated`) merge postings
+    without re-tokenizing the existing corpus.
+    """
+
+    def __init__(self, doc_ids: List[str], vocab: List[str], doc_len: np.ndarray, indptr: np.ndarray,
+                 post_docs: np.ndarray, post_tfs: np.ndarray, post_weights: np.ndarray = None,
+                 idf: np.ndarray = None, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.doc_ids = doc_ids
+        self.terms = vocab
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.doc_len = doc_len
+        self.indptr = indptr
+        self.post_docs = post_docs
+        self.post_tfs = post_tfs
+        self.corpus_size = len(doc_ids)
+        self.avgdl = float(doc_len.mean()) if self.corpus_size else 0.0
+        self.post_weights = post_weights if post_weights is not None else self._compute_weights()
+        self.idf = idf if idf is not None else self._compute_idf(np.diff(indptr))
+        self.fingerprint = None  # corpus fingerprint stored with a saved index (set by load)
+
+    @classmethod
+    def build(cls, doc_ids: List[str], tokenized_corpus: List[List[str]], **params) -> "BM25Index":
+        return cls.empty(**params).updated(doc_ids, tokenized_corpus, [])
+
+    @classmethod
+    def empty(cls, **params) -> "BM25Index":
+        return cls([], [], np.empty(0, dtype=np.float32), np.zeros(1, dtype=np.int64),
+                   np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), **params)
+
+    def _compute_weights(self) -> np.ndarray:
+        # tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl))
+        if not len(self.post_docs):
+            return np.empty(0, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[self.post_docs] / self.avgdl)
+        return (self.post_tfs * (self.k1 + 1) / (self.post_tfs + norm)).astype(np.float32)
+
+    def _compute_idf(self, doc_freqs: np.ndarray) -> np.ndarray:
+        # Same as BM25Okapi: negative idfs are floored to epsilon * average idf
+        if not len(doc_freqs):
+            return np.empty(0, dtype=np.float32)
+        idf = np.log(self.corpus_size - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        eps = self.epsilon * float(idf.mean())
+        idf[idf < 0] = eps
+        return idf.astype(np.float32)
+
+    def updated(self, add_ids: Sequence[str], add_tokens: Sequence[List[str]], remove_ids: Sequence[str]) -> "BM25Index":
+        """
+        Returns a new index with `remove_ids` dropped and `add_ids` inserted (an id that
+        already exists is replaced). Existing postings are filtered and re-numbered with
+        vectorized NumPy ops; only the added documents are tokenized/counted.
+        """
+        drop = set(remove_ids) | set(add_ids)
+        keep = np.fromiter((d not in drop for d in self.doc_ids), dtype=bool, count=self.corpus_size)
+        new_doc_index = np.cumsum(keep) - 1
+
+        # Surviving postings as (term, doc, tf) triples
+        term_of_post = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.indptr))
+        live = keep[self.post_docs] if len(self.post_docs) else np.empty(0, dtype=bool)
+        terms = [term_of_post[live]]
+        docs = [new_doc_index[self.post_docs[live]].astype(np.int32)]
+        tfs = [np.asarray(self.post_tfs[live], dtype=np.float32)]
+
+        doc_ids = [d for d, k in zip(self.doc_ids, keep) if k]
+        doc_len = [np.asarray(self.doc_len[keep], dtype=np.float32)]
+
+        vocab = list(self.terms)
+        vocab_index = dict(self.vocab)
+        new_terms, new_docs, new_tfs, new_lens = [], [], [], []
+        for doc_id, tokens in zip(add_ids, add_tokens):
+            doc_idx = len(doc_ids)
+            doc_ids.append(doc_id)
+            new_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                t = vocab_index.get(term)
+                if t is None:
+                    t = vocab_index[term] = len(vocab)
+                    vocab.append(term)
+                new_terms.append(t)
+                new_docs.append(doc_idx)
+                new_tfs.append(tf)
+        terms.append(np.asarray(new_terms, dtype=np.int64))
+        docs.append(np.asarray(new_docs, dtype=np.int32))
+        tfs.append(np.asarray(new_tfs, dtype=np.float32))
+        doc_len.append(np.asarray(new_lens, dtype=np.float32))
+
+        terms = np.concatenate(terms)
+        docs = np.concatenate(docs)
+        tfs = np.concatenate(tfs)
+
+        # Drop terms that no longer occur anywhere, then rebuild CSR ordered by (term, doc)
+        df = np.bincount(terms, minlength=len(vocab))
+        present = df > 0
+        term_remap = np.cumsum(present) - 1
+        vocab = [t for t, p in zip(vocab, present) if p]
+        terms = term_remap[terms]
+        order = np.lexsort((docs, terms))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df[present], out=indptr[1:])
+
+        return BM25Index(doc_ids, vocab, np.concatenate(doc_len), indptr, docs[order], tfs[order],
+                         k1=self.k1, b=self.b, epsilon=self.epsilon)
+
+    def score(self, query_tokens) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (doc_indices, scores) for every document matching at least one query term."""
+        docs = []
+        weights = []
+        for term in query_tokens:
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs.append(self.post_docs[start:end])
+            weights.append(self.post_weights[start:end] * self.idf[t])
+
+        if not docs:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        docs = np.concatenate(docs)
+        weights = np.concatenate(weights)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        return unique_docs, np.bincount(inverse, weights=weights).astype(np.float32)
+
+    def top_n(self, query_tokens, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-n (doc_indices, scores), best first, using argpartition instead of a full sort."""
+        docs, scores = self.score(query_tokens)
+        if len(scores) > n:
+            part = np.argpartition(-scores, n - 1)[:n]
+            docs, scores = docs[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return docs[order], scores[order]
+
+    def get_scores(self, query_tokens) -> np.ndarray:
+        """Dense scores for every document (BM25Okapi-compatible, mainly for debugging)."""
+        scores = np.zeros(self.corpus_size, dtype=np.float32)
+        docs, doc_scores = self.score(query_tokens)
+        scores[docs] = doc_scores
+        return scores
+
+    # --- Persistence ---
+
+    _ARRAYS = ("doc_len", "indptr", "post_docs", "post_tfs", "post_weights", "idf")
+
+    def save(self, path: str, fingerprint: str = None):
+        """
+        Writes the index to `path` via a temp directory swapped in with a rename.
+        `fingerprint` identifies the corpus state it was built from (see corpus_fingerprint).
+        """
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in self._ARRAYS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(tmp_path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f)
+        with open(os.path.join(tmp_path, "doc_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.doc_ids, f)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": INDEX_FORMAT_VERSION,
+                "corpus_size": self.corpus_size,
+                "fingerprint": fingerprint,
+                "k1": self.k1, "b": self.b, "epsilon": self.epsilon
+            }, f)
+
+        old_path = path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Loads a saved index; numeric arrays are memory-mapped read-only."""
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index version {meta.get('version')}")
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(path, "doc_ids.json"), "r", encoding="utf-8") as f:
+            doc_ids = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in cls._ARRAYS}
+        index = cls(doc_ids, vocab, k1=meta["k1"], b=meta["b"], epsilon=meta["epsilon"], **arrays)
+        index.fingerprint = meta.get("fingerprint")
+        return index
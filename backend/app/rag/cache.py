@@ -0,0 +1,171 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key for a query. all-MiniLM-L6-v2 uses an uncased tokenizer that ignores
+    whitespace runs, so lowercasing and collapsing whitespace never changes the embedding.
+    """
+    return " ".join(query.lower().split())
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a max size and per-entry time-to-live."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < now:
+                del self._data[key]
+                self.misses += 1
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0
+        }
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed by (retrieved chunk ids, query embedding similarity).
+    A lookup only matches entries built from exactly the same context chunks whose
+    query embedding has cosine similarity >= threshold with the new query.
+    Entries are dropped wholesale when the corpus version changes.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600.0, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # entry_id -> (expires_at, context_key, embedding, value)
+        self._by_context = {}  # context_key -> set(entry_id)
+        self._next_id = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version) -> bool:
+        """Clears the cache on a newer corpus version. False if `version` is already stale."""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_context.clear()
+            self._version = version
+        return True
+
+    def _remove(self, entry_id):
+        _, context_key, _, _ = self._entries.pop(entry_id)
+        ids = self._by_context.get(context_key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_context[context_key]
+
+    def get(self, embedding, context_key, version):
+        now = time.monotonic()
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            best_id, best_sim = None, self.threshold
+            for entry_id in list(self._by_context.get(context_key, ())):
+                expires_at, _, cached_embedding, _ = self._entries[entry_id]
+                if expires_at < now:
+                    self._remove(entry_id)
+                    self.evictions += 1
+                    continue
+                # Embeddings are L2-normalized, so the dot product is the cosine similarity
+                sim = float(embedding @ cached_embedding)
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def set(self, embedding, context_key, version, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            # An answer generated against an older corpus must not repopulate the cache
+            if not self._check_version(version):
+                return
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (time.monotonic() + self.ttl, context_key, embedding, value)
+            self._by_context.setdefault(context_key, set()).add(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "similarity_threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0
+        }
@@ -0,0 +1,88 @@
+import os
+import math
+from typing import Dict, List, Tuple
+from app.rag.engine import CHUNK_OVERLAP
+
+# Prompt context is filled up to this many (estimated) LLM tokens, best chunks first
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# At most this many retrieved chunks are considered for the context
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "5"))
+# Llama-style BPE averages ~1.3 tokens per English word; close enough for budgeting
+TOKENS_PER_WORD = float(os.getenv("CONTEXT_TOKENS_PER_WORD", "1.3"))
+
+
+def estimate_tokens(n_words: int) -> int:
+    return int(math.ceil(n_words * TOKENS_PER_WORD))
+
+
+def _position(chunk: Dict) -> Tuple[str, int]:
+    meta = chunk.get("metadata") or {}
+    index = meta.get("chunk_index")
+    return str(meta.get("doc_id", chunk.get("id"))), index if isinstance(index, int) else None
+
+
+def _overlap(prev_words: List[str], words: List[str]) -> int:
+    """Words at the start of `words` that repeat the end of the previous chunk (0 if not adjacent)."""
+    n = min(CHUNK_OVERLAP, len(prev_words), len(words))
+    return n if n and prev_words[-n:] == words[:n] else 0
+
+
+def build_context(chunks: List[Dict], budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, List[Dict]]:
+    """
+    Assembles prompt context from ranked chunks (best first). Returns (context, used chunks).
+
+    Chunks are taken in rank order while they fit the token budget. A chunk adjacent to
+    one already taken from the same doc only costs its new words, since the CHUNK_OVERLAP
+    words it shares with its neighbour are emitted once. Contiguous chunks are merged
+    into a single passage; passages are ordered by their best-ranked chunk. The top
+    chunk is always used, even if it alone exceeds the budget.
+    """
+    words = [c["text"].split() for c in chunks]
+    positions = [_position(c) for c in chunks]
+    taken = {}  # (doc_id, chunk_index) -> rank, for adjacency checks
+    selected = []
+    used_tokens = 0
+
+    for rank, chunk in enumerate(chunks):
+        doc_id, index = positions[rank]
+        new_words = len(words[rank])
+        if index is not None:
+            for neighbour in (index - 1, index + 1):
+                other = taken.get((doc_id, neighbour))
+                if other is None:
+                    continue
+                before, after = (words[other], words[rank]) if neighbour < index else (words[rank], words[other])
+                new_words -= _overlap(before, after)
+        cost = estimate_tokens(max(new_words, 0))
+        if selected and used_tokens + cost > budget:
+            continue
+        selected.append(rank)
+        used_tokens += cost
+        if index is not None:
+            taken[(doc_id, index)] = rank
+
+    # Merge runs of consecutive chunk indexes within a doc into one passage
+    passages = []  # (best rank, words)
+    by_doc = {}
+    for rank in selected:
+        doc_id, index = positions[rank]
+        by_doc.setdefault(doc_id if index is not None else ("#", rank), []).append(rank)
+    for ranks in by_doc.values():
+        ranks.sort(key=lambda r: positions[r][1] if positions[r][1] is not None else 0)
+        run, run_words = [ranks[0]], list(words[ranks[0]])
+        for rank in ranks[1:]:
+            prev = run[-1]
+            if positions[prev][1] is not None and positions[rank][1] == positions[prev][1] + 1:
+                run_words.extend(words[rank][_overlap(words[prev], words[rank]):])
+                run.append(rank)
+                continue
+            passages.append((min(run), run_words))
+            run, run_words = [rank], list(words[rank])
+        passages.append((min(run), run_words))
+
+    passages.sort(key=lambda p: p[0])
+    context = "\n\n".join(" ".join(passage_words) for _, passage_words in passages)
+    used = [chunks[rank] for rank in sorted(selected)]
+    print(f"DEBUG: Context {len(used)}/{len(chunks)} chunks in {len(passages)} passages, "
+          f"~{used_tokens} tokens (budget {budget})")
+    return context, used
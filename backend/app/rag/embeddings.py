@@ -0,0 +1,68 @@
+import os
+from sentence_transformers import SentenceTransformer
+
+# Embedding backend selection
+#   torch - SentenceTransformer on PyTorch (default)
+#   onnx  - SentenceTransformer on ONNX Runtime; needs `pip install "sentence-transformers[onnx]"`
+#           (sentence-transformers >= 3.2). With EMBEDDING_QUANTIZE=1 the int8
+#           dynamically-quantized export shipped in the model repo is used.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "0") == "1"
+# Explicit ONNX file inside the model repo, e.g. onnx/model_qint8_avx512_vnni.onnx
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+
+ONNX_FP32_FILE = "onnx/model.onnx"
+# The AVX2 int8 export is unsigned (quint8); the arm64/avx512/avx512_vnni ones are qint8
+ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+def onnx_file(quantize: bool = EMBEDDING_QUANTIZE) -> str:
+    return EMBEDDING_ONNX_FILE or (ONNX_INT8_FILE if quantize else ONNX_FP32_FILE)
+
+
+def load_torch(model_id: str, quantize: bool = False) -> SentenceTransformer:
+    return SentenceTransformer(model_id)
+
+
+def load_onnx(model_id: str, quantize: bool = EMBEDDING_QUANTIZE) -> SentenceTransformer:
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        raise RuntimeError(
+            "EMBEDDING_BACKEND=onnx requires ONNX Runtime: pip install \"sentence-transformers[onnx]\""
+        )
+    file_name = onnx_file(quantize)
+    try:
+        return SentenceTransformer(model_id, backend="onnx", model_kwargs={"file_name": file_name})
+    except Exception as e:
+        # No silent fallback to another file: it would embed into a different vector space
+        # than the one recorded under embedding_model_key
+        raise RuntimeError(
+            f"Failed to load ONNX file '{file_name}' for {model_id}: {e}. Set EMBEDDING_ONNX_FILE "
+            f"to a file listed under onnx/ in the model repo (e.g. {ONNX_FP32_FILE})."
+        ) from e
+
+
+EMBEDDING_BACKENDS = {
+    "torch": load_torch,
+    "onnx": load_onnx,
+}
+
+
+def load_embedding_model(model_id: str, backend: str = EMBEDDING_BACKEND, quantize: bool = EMBEDDING_QUANTIZE):
+    """Loads `model_id` with the given backend. All backends expose SentenceTransformer.encode."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Options: {sorted(EMBEDDING_BACKENDS)}")
+    print(f"DEBUG: Embedding backend={backend} quantize={quantize if backend == 'onnx' else False}")
+    return EMBEDDING_BACKENDS[backend](model_id, quantize)
+
+
+def embedding_model_key(model_id: str, backend: str = EMBEDDING_BACKEND, quantize: bool = EMBEDDING_QUANTIZE) -> str:
+    """
+    Identifies the vector space stored in the collection (recorded in the ingest manifest).
+    PyTorch and fp32 ONNX produce the same vectors, so they share a key and switching
+    between them needs no re-embedding; any other ONNX file (e.g. int8) gets its own key.
+    """
+    if backend == "onnx" and onnx_file(quantize) != ONNX_FP32_FILE:
+        return f"{model_id}@{onnx_file(quantize)}"
+    return model_id
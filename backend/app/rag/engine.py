@@ -1,10 +1,31 @@
 import os
 import json
-from typing import List, Dict
+import time
+import threading
+import multiprocessing
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, replace
+from typing import List, Dict, Optional
 import chromadb
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
-from pypdf import PdfReader
+from app.rag.embeddings import load_embedding_model, embedding_model_key
+from app.rag.pdf import page_count, page_ranges, extract_pages, join_pages
+import numpy as np
+from app.rag.cache import TTLCache, normalize_query
+from app.rag.batcher import EmbeddingBatcher
+from app.rag.bm25 import BM25Index, tokenize, tokenize_query
+from app.rag.vector_store import HnswVectorStore, ExactVectorIndex
+from app.core.metrics import metrics
+from app.core.tracing import span, record_span
+from app.rag.manifest import (
+    load_manifest,
+    save_manifest,
+    make_entry,
+    file_sha256,
+    same_pipeline,
+    stat_unchanged,
+    corpus_fingerprint,
+)
 
 # Setup - Detect if running on Hugging Face Spaces
 IS_HF_SPACE = os.getenv("SPACE_ID") is not None
@@ -24,19 +45,104 @@ if IS_HF_SPACE:
     os.makedirs(DB_PATH, exist_ok=True)
 
 COLLECTION_NAME = "docs_collection"
+# Ingestion manifest lives with the vector store so wiping chroma_db also resets it
+MANIFEST_PATH = os.path.join(DB_PATH, "ingest_manifest.json")
+# Persisted BM25 postings/IDF (memory-mapped on load)
+BM25_INDEX_PATH = os.path.join(DB_PATH, "bm25_index")
+# In-process HNSW index + embedding matrix (VECTOR_BACKEND=hnsw)
+HNSW_INDEX_PATH = os.path.join(DB_PATH, "hnsw_index")
+
+# Vector search backend: "chroma" queries the collection, "hnsw" queries the in-process
+# index under HNSW_INDEX_PATH (Chroma still stores chunk text/metadata in both cases)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+# Exact (brute-force) vs approximate search: "auto" searches exactly while the corpus has at
+# most EXACT_SEARCH_MAX_CHUNKS chunks and falls back to the ANN backend above that
+VECTOR_SEARCH_MODE = os.getenv("VECTOR_SEARCH_MODE", "auto").lower()
+EXACT_SEARCH_MAX_CHUNKS = int(os.getenv("EXACT_SEARCH_MAX_CHUNKS", "20000"))
+# Page size when copying embeddings out of Chroma (HNSW migration, exact index build)
+VECTOR_MIGRATE_BATCH = int(os.getenv("VECTOR_MIGRATE_BATCH", "5000"))
+
+EMBEDDING_MODEL_ID = "all-MiniLM-L6-v2"
+# Model + backend identity recorded in the manifest; a change forces re-embedding
+EMBEDDING_MODEL_KEY = embedding_model_key(EMBEDDING_MODEL_ID)
+
+# Chunking - bump CHUNKER_VERSION whenever chunk_text output changes so the
+# manifest forces affected files to be re-chunked
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 50
+CHUNKER_VERSION = f"words-v1-{CHUNK_SIZE}-{CHUNK_OVERLAP}"
+
+# Ingestion parallelism: PDF pages are extracted in a process pool, in page ranges
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Page-range tasks in flight per worker. Extraction only runs this far ahead of embedding,
+# so extracted text waiting in finished tasks stays bounded instead of growing with the corpus
+PDF_TASKS_PER_WORKER = int(os.getenv("PDF_TASKS_PER_WORKER", "2"))
+# Streaming ingestion: chunks are embedded and upserted this many at a time
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Ingest progress is checkpointed to the manifest every this many batches (and at the end).
+# Each save rewrites the whole manifest, so saving every batch is O(corpus^2) I/O; an
+# interrupted run re-embeds at most this many batches
+MANIFEST_SAVE_BATCHES = int(os.getenv("MANIFEST_SAVE_BATCHES", "32"))
+# Pending BM25 additions are merged into the index once this many accumulate
+BM25_DELTA_MAX = int(os.getenv("BM25_DELTA_MAX", "4096"))
+# Below this many pages, worker start-up costs more than it saves - extract inline
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+# Query embedding cache (FAQ-style traffic repeats a lot)
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "3600"))
+
+_query_embedding_cache = TTLCache(maxsize=QUERY_EMBED_CACHE_SIZE, ttl=QUERY_EMBED_CACHE_TTL)
+metrics.register_cache("query_embedding", _query_embedding_cache)
+
+# Micro-batching of concurrent query embeddings (cache misses only)
+EMBED_BATCHER_ENABLED = os.getenv("EMBED_BATCHER_ENABLED", "1") == "1"
+EMBED_BATCHER_MAX_BATCH = int(os.getenv("EMBED_BATCHER_MAX_BATCH", "32"))
+EMBED_BATCHER_WAIT_MS = float(os.getenv("EMBED_BATCHER_WAIT_MS", "0"))
+
+# Hybrid retrieval runs the BM25 leg here while the vector leg runs on the caller's thread
+RETRIEVAL_LEG_WORKERS = int(os.getenv("RETRIEVAL_LEG_WORKERS", "4"))
+_retrieval_leg_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_LEG_WORKERS, thread_name_prefix="rag-leg")
 
 # Lazy initialization
 _model = None
 _collection = None
 
+_model_lock = threading.Lock()
+
 def get_model():
     global _model
     if _model is None:
-        print("Loading Embedding Model...")
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Model Loaded")
+        # Double-checked: concurrent first requests must not load the model twice
+        with _model_lock:
+            if _model is None:
+                print("Loading Embedding Model...")
+                _model = load_embedding_model(EMBEDDING_MODEL_ID)
+                print("Model Loaded")
     return _model
 
+def warmup_retrieval() -> float:
+    """
+    Loads the embedding model, runs dummy inputs through it and touches the vector
+    index, so the first real query pays none of the one-off costs. Returns seconds taken.
+    """
+    start = time.perf_counter()
+    m = get_model()
+    # Exercise both the ingest (batched) and the query (single input) shapes
+    m.encode(["warm up passage for the embedding model"] * 8, normalize_embeddings=True)
+    embedding = m.encode(["warm up query"], normalize_embeddings=True)
+    # First query loads the HNSW index from disk
+    col = get_collection()
+    if col.count() > 0:
+        col.query(query_embeddings=embedding.tolist(), n_results=1)
+    snapshot = get_snapshot()
+    if snapshot.vectors is not None:
+        snapshot.vectors.search(embedding[0], 1)
+    if snapshot.exact is not None:
+        snapshot.exact.search(embedding[0], 1)
+    return time.perf_counter() - start
+
 def get_collection():
     global _collection
     if _collection is None:
@@ -47,84 +153,400 @@ def get_collection():
         )
     return _collection
 
-# BM25 Global State
-bm25 = None
-bm25_chunks = []
-bm25_metadatas = []
+# Retrieval State
+# Everything the query path reads lives in one immutable snapshot. Writers build a new
+# snapshot off to the side and publish it with a single reference assignment, so readers
+# never need a lock and never see BM25 postings from one corpus with ids from another.
+@dataclass(frozen=True)
+class RetrievalSnapshot:
+    bm25: Optional[BM25Index] = None  # holds chunk ids and postings; chunk text stays in Chroma
+    vectors: Optional[HnswVectorStore] = None  # only with VECTOR_BACKEND=hnsw; updated in place under its own lock
+    exact: Optional[ExactVectorIndex] = None  # brute-force matrix; None when the corpus is too big (or mode=ann)
+    version: int = 0  # corpus version - bumped whenever ingestion changes the collection
+    published_at: float = 0.0
+
+_snapshot = RetrievalSnapshot()
+# Makes each snapshot swap atomic, so concurrent _publish calls never drop each other's
+# fields. It does not cover a whole read-build-publish sequence: writers that rebuild an
+# index hold _ingest_lock for that. The read path never takes either lock.
+_publish_lock = threading.Lock()
+
+def get_snapshot() -> RetrievalSnapshot:
+    return _snapshot
+
+def _publish(**changes) -> RetrievalSnapshot:
+    global _snapshot
+    with _publish_lock:
+        _snapshot = replace(_snapshot, published_at=time.time(), **changes)
+        return _snapshot
+
+def get_corpus_version() -> int:
+    return _snapshot.version
 
 def init_bm25():
-    """Initializes BM25 from existing ChromaDB data."""
-    global bm25, bm25_chunks, bm25_metadatas
+    """
+    Loads the persisted BM25 index, rebuilding it from ChromaDB if missing or out of sync.
+    In sync means same chunk count and same corpus fingerprint as the ingest manifest, so
+    an index saved before a same-size content change is not mistaken for a current one.
+    """
     try:
         col = get_collection()
-        results = col.get()
-        if results and results['documents']:
-            bm25_chunks = results['documents']
-            bm25_metadatas = results['metadatas']
-            tokenized_corpus = [doc.split() for doc in bm25_chunks]
-            bm25 = BM25Okapi(tokenized_corpus)
-            print(f"BM25 initialized with {len(bm25_chunks)} chunks.")
+        count = col.count()
+        fingerprint = corpus_fingerprint(load_manifest(MANIFEST_PATH))
+        if os.path.exists(BM25_INDEX_PATH):
+            try:
+                index = BM25Index.load(BM25_INDEX_PATH)
+                if index.corpus_size == count and index.fingerprint == fingerprint:
+                    _publish(bm25=index)
+                    print(f"BM25 loaded from disk with {index.corpus_size} chunks.")
+                    return
+                print(f"DEBUG: BM25 index ({index.corpus_size} chunks) does not match the collection "
+                      f"({count} chunks) or manifest. Rebuilding...")
+            except Exception as e:
+                print(f"BM25 Load Error (rebuilding): {e}")
+
+        results = col.get(include=["documents"])
+        tokenized_corpus = [tokenize(doc) for doc in results['documents']]
+        index = BM25Index.build(results['ids'], tokenized_corpus)
+        index.save(BM25_INDEX_PATH, fingerprint)
+        _publish(bm25=index)
+        print(f"BM25 initialized with {index.corpus_size} chunks.")
     except Exception as e:
         print(f"BM25 Init Error: {e}")
 
+def update_bm25(add_ids: List[str], add_texts: List[str], remove_ids: List[str], persist: bool = True,
+                fingerprint: str = None):
+    """
+    Applies an ingest delta (upserted and deleted chunks) to the BM25 index and optionally
+    persists it, stamped with `fingerprint` (the manifest the delta brings it up to).
+    """
+    if _snapshot.bm25 is None:
+        # e.g. reingest.py in a fresh process - load (or rebuild) first, then apply the delta.
+        # Re-applying it to an index rebuilt from the already-updated collection is a no-op.
+        init_bm25()
+    current = _snapshot.bm25
+    if current is None:
+        return
+    try:
+        # Built off to the side; queries keep using `current` until the swap
+        index = current.updated(add_ids, [tokenize(t) for t in add_texts], remove_ids)
+        _publish(bm25=index)
+        if persist:
+            index.save(BM25_INDEX_PATH, fingerprint)
+        print(f"BM25 updated: +{len(add_ids)} -{len(remove_ids)} -> {index.corpus_size} chunks.")
+    except Exception as e:
+        print(f"BM25 Update Error (rebuilding): {e}")
+        init_bm25()
+
+def _iter_chroma_embeddings():
+    """Yields (ids, float32 embeddings) pages of VECTOR_MIGRATE_BATCH from the collection."""
+    col = get_collection()
+    offset = 0
+    while True:
+        page = col.get(include=["embeddings"], limit=VECTOR_MIGRATE_BATCH, offset=offset)
+        if not len(page["ids"]):
+            return
+        yield page["ids"], np.asarray(page["embeddings"], dtype=np.float32)
+        offset += len(page["ids"])
+
+def build_vector_store(path: str = None, **params) -> HnswVectorStore:
+    """
+    Copies every embedding out of Chroma into a new HNSW index and saves it to `path`,
+    stamped with the fingerprint of the current ingest manifest.
+    """
+    path = path or HNSW_INDEX_PATH
+    fingerprint = corpus_fingerprint(load_manifest(MANIFEST_PATH))
+    store = None
+    copied = 0
+    for ids, embeddings in _iter_chroma_embeddings():
+        if store is None:
+            store = HnswVectorStore.build(path, ids, embeddings, **params)
+        else:
+            store.upsert(ids, embeddings)
+        copied += len(ids)
+        print(f"DEBUG: HNSW migration copied {copied} vectors")
+    if store is None:
+        # Empty collection: dimension comes from the model
+        dim = get_model().get_sentence_embedding_dimension()
+        store = HnswVectorStore.build(path, [], np.empty((0, dim), dtype=np.float32), **params)
+    store.save(fingerprint)
+    return store
+
+def init_vector_store():
+    """
+    With VECTOR_BACKEND=hnsw, loads the HNSW index, migrating from Chroma if missing or out
+    of sync. In sync means the same chunk count and corpus fingerprint as the ingest manifest
+    (as for BM25), so a store left behind by an ingest that ran with another backend or
+    crashed before saving it is not served with old vectors.
+    """
+    if VECTOR_BACKEND != "hnsw":
+        return
+    try:
+        count = get_collection().count()
+        fingerprint = corpus_fingerprint(load_manifest(MANIFEST_PATH))
+        if os.path.exists(HNSW_INDEX_PATH):
+            try:
+                store = HnswVectorStore.load(HNSW_INDEX_PATH)
+                if len(store) == count and store.fingerprint == fingerprint:
+                    _publish(vectors=store)
+                    print(f"HNSW index loaded from disk with {len(store)} vectors.")
+                    return
+                print(f"DEBUG: HNSW index ({len(store)} vectors) does not match the collection "
+                      f"({count} chunks) or manifest. Rebuilding...")
+            except Exception as e:
+                print(f"HNSW Load Error (rebuilding): {e}")
+
+        store = build_vector_store()
+        _publish(vectors=store)
+        print(f"HNSW index initialized with {len(store)} vectors.")
+    except Exception as e:
+        # Queries fall back to Chroma while no index is published
+        print(f"HNSW Init Error: {e}")
+
+def _exact_allowed(size: int) -> bool:
+    if VECTOR_SEARCH_MODE == "exact":
+        return True
+    return VECTOR_SEARCH_MODE == "auto" and size <= EXACT_SEARCH_MAX_CHUNKS
+
+def _build_exact_index(count: int) -> ExactVectorIndex:
+    """Copies from the HNSW store's matrix when that is in sync, otherwise pages from Chroma."""
+    vectors = _snapshot.vectors
+    if vectors is not None and len(vectors) == count:
+        return vectors.exact_index()
+    ids, embeddings = [], []
+    for page_ids, page_embeddings in _iter_chroma_embeddings():
+        ids.extend(page_ids)
+        embeddings.append(page_embeddings)
+    dim = embeddings[0].shape[1] if embeddings else get_model().get_sentence_embedding_dimension()
+    return ExactVectorIndex.build(ids, np.concatenate(embeddings) if embeddings else np.empty((0, dim)))
+
+def init_exact_index() -> Optional[ExactVectorIndex]:
+    """Builds and publishes the brute-force index if the search mode/corpus size call for it."""
+    try:
+        count = get_collection().count()
+        if not _exact_allowed(count):
+            _publish(exact=None)
+            return None
+        index = _build_exact_index(count)
+        _publish(exact=index)
+        print(f"Exact vector index built with {len(index)} chunks ({index.matrix.dtype}).")
+        return index
+    except Exception as e:
+        print(f"Exact Index Init Error: {e}")
+        return None
+
+def init_missing_indexes():
+    """Loads (or rebuilds) every retrieval index the snapshot does not hold yet."""
+    if _snapshot.bm25 is None:
+        init_bm25()
+    if VECTOR_BACKEND == "hnsw" and _snapshot.vectors is None:
+        init_vector_store()
+    if _snapshot.exact is None:
+        init_exact_index()
+
+def init_retrieval():
+    """
+    Startup: loads (or rebuilds) every retrieval index. Runs under the ingest lock, so an
+    ingest job accepted during warmup cannot publish its indexes and then have them
+    overwritten by a slower startup build of the older corpus state; if a job got there
+    first, its indexes are kept.
+    """
+    with _ingest_lock:
+        init_missing_indexes()
+
+# Exact index for retrieve_docs(exact=True) when the configured mode publishes none.
+# Kept out of the snapshot so forcing exact search (eval/recall tooling) never switches
+# the default query path; rebuilt when the corpus version changes. (version, index)
+_forced_exact = (None, None)
+_forced_exact_lock = threading.Lock()
+
+def forced_exact_index() -> ExactVectorIndex:
+    global _forced_exact
+    snapshot = get_snapshot()
+    if snapshot.exact is not None:
+        return snapshot.exact
+    with _forced_exact_lock:
+        version, index = _forced_exact
+        if index is None or version != snapshot.version:
+            index = _build_exact_index(get_collection().count())
+            _forced_exact = (snapshot.version, index)
+            print(f"Exact vector index built for forced exact search with {len(index)} chunks.")
+        return index
+
+def update_exact_index(add_ids: List[str], add_embeddings, remove_ids: List[str]):
+    """Applies an ingest delta to the exact index; drops it once the corpus outgrows exact search."""
+    current = _snapshot.exact
+    if current is None:
+        return  # (re)built by init_exact_index at the end of ingestion if the corpus allows
+    try:
+        index = current.updated(add_ids, add_embeddings, remove_ids)
+        if not _exact_allowed(len(index)):
+            print(f"DEBUG: Corpus has {len(index)} chunks - switching to approximate vector search.")
+            index = None
+        _publish(exact=index)
+    except Exception as e:
+        print(f"Exact Index Update Error (rebuilding): {e}")
+        init_exact_index()
+
 # Call init on startup? No, move to FastAPI startup_event to avoid import-time crashes.
 # init_bm25()
 
-def load_docs() -> List[Dict]:
-    """Loads both JSON and PDF documents from their respective directories."""
-    docs = []
-    print(f"DEBUG: load_docs searching in DATA_DIR={DATA_DIR}")
-    
-    # 1. Load JSONs from data/docs
+def list_source_files() -> List[Dict]:
+    """Lists ingestible files as {key, path, kind}. Keys are paths relative to DATA_DIR."""
+    sources = []
+
+    # 1. JSONs from data/docs
     if os.path.exists(DOCS_DIR):
-        print(f"DEBUG: Found DOCS_DIR={DOCS_DIR}")
-        for filename in os.listdir(DOCS_DIR):
+        for filename in sorted(os.listdir(DOCS_DIR)):
             if filename.endswith(".json"):
                 path = os.path.join(DOCS_DIR, filename)
-                with open(path, "r", encoding="utf-8") as f:
-                    try:
-                        data = json.load(f)
-                        docs.append(data)
-                        print(f"DEBUG: Loaded JSON: {filename}")
-                    except Exception as e:
-                        print(f"ERROR: Failed to load JSON {filename}: {e}")
+                sources.append({"key": os.path.relpath(path, DATA_DIR), "path": path, "kind": "json"})
     else:
         print(f"DEBUG: DOCS_DIR NOT FOUND: {DOCS_DIR}")
-    
-    # 2. Load PDFs from data/
+
+    # 2. PDFs from data/
     if os.path.exists(DATA_DIR):
-        print(f"DEBUG: Searching for PDFs in {DATA_DIR}")
-        all_files = os.listdir(DATA_DIR)
-        print(f"DEBUG: Files in DATA_DIR: {all_files}")
-        for filename in all_files:
+        for filename in sorted(os.listdir(DATA_DIR)):
             if filename.lower().endswith(".pdf"):
                 path = os.path.join(DATA_DIR, filename)
-                try:
-                    print(f"DEBUG: Attempting to read PDF: {filename} (Size: {os.path.getsize(path)} bytes)")
-                    reader = PdfReader(path)
-                    text = ""
-                    for i, page in enumerate(reader.pages):
-                        extracted = page.extract_text()
-                        if extracted:
-                            text += extracted + "\n"
-                    
-                    if text.strip():
-                        docs.append({
-                            "id": filename,
-                            "title": filename,
-                            "body": text
-                        })
-                        print(f"DEBUG: Successfully loaded PDF: {filename} ({len(text)} chars)")
-                    else:
-                        print(f"DEBUG: PDF {filename} is EMPTY or NO TEXT EXTRACTED.")
-                except Exception as e:
-                    print(f"ERROR: Failed to load PDF {filename}: {e}")
+                sources.append({"key": filename, "path": path, "kind": "pdf"})
     else:
         print(f"DEBUG: DATA_DIR NOT FOUND: {DATA_DIR}")
-                    
+
+    return sources
+
+def _pdf_docs(source: Dict, texts: List[str]) -> List[Dict]:
+    filename = os.path.basename(source["path"])
+    text = join_pages(texts)
+    if not text.strip():
+        print(f"DEBUG: PDF {filename} is EMPTY or NO TEXT EXTRACTED.")
+        return []
+    print(f"DEBUG: Successfully loaded PDF: {filename} ({len(text)} chars)")
+    return [{"id": filename, "title": filename, "body": text}]
+
+def load_file(source: Dict) -> List[Dict]:
+    """Parses a single source file into zero or more docs ({id, title, body})."""
+    path = source["path"]
+    filename = os.path.basename(path)
+
+    if source["kind"] == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        print(f"DEBUG: Loaded JSON: {filename}")
+        return [data]
+
+    print(f"DEBUG: Attempting to read PDF: {filename} (Size: {os.path.getsize(path)} bytes)")
+    texts, _ = extract_pages(path, 0, page_count(path))
+    return _pdf_docs(source, texts)
+
+def parse_sources(sources: List[Dict]):
+    """
+    Parses sources, yielding (source, docs, error, timing) as each file completes.
+    PDF page extraction is fanned out over a process pool in page ranges of
+    PDF_PAGES_PER_TASK, so one large PDF and many small ones both use every core.
+    At most PDF_TASKS_PER_WORKER ranges per worker are in flight, topped up as results
+    are consumed, so extraction cannot run arbitrarily far ahead of embedding.
+    timing = {"seconds": extraction time summed over the file's page ranges, "pages": n}.
+    """
+    pending = {}  # key -> per-file progress
+    tasks = []  # (key, range_index, start, end)
+
+    for source in sources:
+        t0 = time.perf_counter()
+        try:
+            if source["kind"] == "json":
+                docs = load_file(source)
+                yield source, docs, None, {"seconds": round(time.perf_counter() - t0, 4), "pages": None}
+                continue
+            n_pages = page_count(source["path"])
+        except Exception as e:
+            yield source, [], e, {"seconds": round(time.perf_counter() - t0, 4), "pages": None}
+            continue
+
+        ranges = page_ranges(n_pages, PDF_PAGES_PER_TASK)
+        if not ranges:
+            yield source, _pdf_docs(source, []), None, {"seconds": 0.0, "pages": 0}
+            continue
+        pending[source["key"]] = {
+            "source": source, "parts": [None] * len(ranges), "remaining": len(ranges),
+            "seconds": time.perf_counter() - t0, "pages": n_pages, "error": None
+        }
+        tasks.extend((source["key"], i, start, end) for i, (start, end) in enumerate(ranges))
+
+    def complete(key, i, result, error):
+        state = pending[key]
+        if error is not None:
+            state["error"] = error
+        else:
+            state["parts"][i], seconds = result
+            state["seconds"] += seconds
+        state["remaining"] -= 1
+        if state["remaining"]:
+            return None
+        del pending[key]
+        timing = {"seconds": round(state["seconds"], 4), "pages": state["pages"]}
+        if state["error"] is not None:
+            return state["source"], [], state["error"], timing
+        texts = [t for part in state["parts"] for t in part]
+        return state["source"], _pdf_docs(state["source"], texts), None, timing
+
+    if not tasks:
+        return
+
+    total_pages = sum(state["pages"] for state in pending.values())
+    if INGEST_WORKERS <= 1 or len(tasks) == 1 or total_pages < PDF_PARALLEL_MIN_PAGES:
+        for key, i, start, end in tasks:
+            try:
+                done = complete(key, i, extract_pages(pending[key]["source"]["path"], start, end), None)
+            except Exception as e:
+                done = complete(key, i, None, e)
+            if done:
+                yield done
+        return
+
+    # spawn (not fork): the parent holds torch/Chroma threads that must not be forked
+    ctx = multiprocessing.get_context("spawn")
+    workers = min(INGEST_WORKERS, len(tasks))
+    window = max(workers * PDF_TASKS_PER_WORKER, 1)
+    queued = iter(tasks)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {}  # future -> (key, range_index); at most `window` at a time
+
+        def top_up():
+            while len(futures) < window:
+                task = next(queued, None)
+                if task is None:
+                    return
+                key, i, start, end = task
+                futures[pool.submit(extract_pages, pending[key]["source"]["path"], start, end)] = (key, i)
+
+        top_up()
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, i = futures.pop(future)
+                try:
+                    done = complete(key, i, future.result(), None)
+                except Exception as e:
+                    done = complete(key, i, None, e)
+                if done:
+                    # The consumer embeds this file before asking for more; new tasks are
+                    # only submitted once it does
+                    yield done
+            top_up()
+
+def load_docs() -> List[Dict]:
+    """Loads both JSON and PDF documents from their respective directories."""
+    docs = []
+    print(f"DEBUG: load_docs searching in DATA_DIR={DATA_DIR}")
+    for source in list_source_files():
+        try:
+            docs.extend(load_file(source))
+        except Exception as e:
+            print(f"ERROR: Failed to load {source['kind'].upper()} {source['key']}: {e}")
     return docs
 
-def chunk_text(text: str, chunk_size: int = 300, overlap: int = 50) -> List[str]:
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """Splits text into overlapping chunks of words. Increased size for better context."""
     words = text.split()
     chunks = []
@@ -134,78 +556,336 @@ def chunk_text(text: str, chunk_size: int = 300, overlap: int = 50) -> List[str]
             chunks.append(chunk)
     return chunks
 
-def ingest_docs():
-    """Reads docs, chunks them, embeds, and stores in Chroma."""
-    docs = load_docs()
-    all_chunks = []
-    all_ids = []
-    all_metadatas = []
-    
+# Only one ingestion may write to the collection at a time (API jobs, startup, scripts)
+_ingest_lock = threading.Lock()
+
+def ingest_docs(force: bool = False, progress=None):
+    """
+    Incrementally ingests docs using the on-disk manifest.
+    Only new or modified files (or files produced by an older chunker/model) are parsed,
+    chunked and embedded; chunks belonging to deleted files are removed from Chroma.
+    force=True re-ingests every file regardless of the manifest.
+
+    Ingestion is a streaming pipeline: parse -> chunk -> embed/upsert in batches of
+    EMBED_BATCH_SIZE, so peak memory is bounded by the batch size rather than the corpus.
+    A file's manifest entry is only written once all of its chunks are stored, and the
+    manifest is saved every MANIFEST_SAVE_BATCHES batches, so an interrupted run resumes
+    from its last checkpoint. progress(dict), if given, is called after
+    every batch.
+    """
+    with _ingest_lock:
+        return _ingest_docs(force, progress)
+
+def _ingest_docs(force: bool, progress):
+    manifest = load_manifest(MANIFEST_PATH)
+    new_manifest = {}
+
     files_processed = []
+    files_skipped = []
+    files_removed = []
+    file_timings = {}
     errors = []
     doc_count = 0
     chunk_count = 0
-    
-    for doc in docs:
-        doc_id = str(doc.get("id"))
-        title = doc.get("title", "Untitled")
-        body = doc.get("body", "")
-        
-        chunks = chunk_text(body)
-        
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id}_{i}"
-            all_chunks.append(chunk)
-            all_ids.append(chunk_id)
-            all_metadatas.append({"doc_id": doc_id, "title": title, "chunk_index": i})
-            
-        doc_count += 1
-        chunk_count += len(chunks)
-        files_processed.append(title)
+    chunks_embedded = 0
+    chunks_deleted = 0
+    batches = 0
+    unsaved_batches = 0  # batches since the manifest was last saved
+    manifest_dirty = False  # files finished since then
 
-    if all_chunks:
+    # 1. PLAN - decide which files changed
+    sources = list_source_files()
+    to_parse = []  # sources that are new or changed
+    file_state = {}  # key -> (previous entry, stat, sha256)
+    for source in sources:
+        key = source["key"]
+        entry = manifest.get(key)
         try:
-            # Generate embeddings with normalization for better cosine similarity
-            m = get_model()
-            embeddings = m.encode(all_chunks, normalize_embeddings=True).tolist()
-            
-            # Add to Chroma (upsert overwrites if ID exists)
-            col = get_collection()
-            col.upsert(
-                documents=all_chunks,
-                embeddings=embeddings,
-                metadatas=all_metadatas,
-                ids=all_ids
-            )
-            # Refresh BM25
+            stat = os.stat(source["path"])
+            if entry and not force and same_pipeline(entry, CHUNKER_VERSION, EMBEDDING_MODEL_KEY):
+                if stat_unchanged(entry, stat):
+                    new_manifest[key] = entry
+                    files_skipped.append(key)
+                    continue
+                # mtime changed (e.g. fresh checkout) - fall back to the content hash
+                sha = file_sha256(source["path"])
+                if sha == entry.get("sha256"):
+                    new_manifest[key] = make_entry(stat, sha, CHUNKER_VERSION, EMBEDDING_MODEL_KEY,
+                                                   entry.get("doc_ids", []), entry.get("chunk_ids", []))
+                    files_skipped.append(key)
+                    continue
+            else:
+                sha = file_sha256(source["path"])
+        except Exception as e:
+            errors.append(f"Failed to load {key}: {e}")
+            if entry:
+                new_manifest[key] = entry
+            continue
+        to_parse.append(source)
+        file_state[key] = (entry, stat, sha)
+        # Keep the old entry until the new chunks are stored, so a failed run is retried
+        if entry:
+            new_manifest[key] = entry
+
+    current_keys = {s["key"] for s in sources}
+    removed = {key: entry for key, entry in manifest.items() if key not in current_keys}
+
+    def report(stage: str):
+        if progress:
+            progress({
+                "stage": stage,
+                "files_total": len(to_parse),
+                "files_parsed": len(file_timings),
+                "files_skipped": len(files_skipped),
+                "docs_parsed": doc_count,
+                "chunks_total": chunk_count,
+                "chunks_embedded": chunks_embedded,
+                "batches": batches
+            })
+
+    # 2. STREAM - parse -> chunk -> embed/upsert in fixed-size batches
+    batch = []  # (chunk_id, text, metadata, file_key)
+    open_files = {}  # key -> {"remaining": chunks not yet stored, "entry": new manifest entry, "stale": old ids}
+    upserted_ids = set()  # never delete an id that another file re-added in this run
+    bm25_add_ids, bm25_add_texts, bm25_remove_ids = [], [], []
+    exact_add_embeddings = []  # parallel to bm25_add_ids, in flush batches
+    col = None
+    if to_parse or removed:
+        # e.g. reingest.py - the indexes must see this run's changes or they drift from Chroma
+        if _snapshot.bm25 is None:
             init_bm25()
+        if VECTOR_BACKEND == "hnsw" and _snapshot.vectors is None:
+            init_vector_store()
+    vectors = _snapshot.vectors
+    parse_seconds = 0.0
+
+    def apply_bm25_delta(persist: bool):
+        if bm25_add_ids or bm25_remove_ids:
+            update_bm25(bm25_add_ids, bm25_add_texts, bm25_remove_ids, persist=persist,
+                        fingerprint=corpus_fingerprint(new_manifest) if persist else None)
+            add_embeddings = np.concatenate(exact_add_embeddings) if exact_add_embeddings else []
+            update_exact_index(bm25_add_ids, add_embeddings, bm25_remove_ids)
+            exact_add_embeddings.clear()
+            bm25_add_ids.clear()
+            bm25_add_texts.clear()
+            bm25_remove_ids.clear()
+
+    def finish_file(key):
+        nonlocal chunks_deleted, manifest_dirty
+        state = open_files.pop(key)
+        stale = [cid for cid in state["stale"] if cid not in upserted_ids]
+        if stale:
+            col.delete(ids=stale)
+            if vectors is not None:
+                vectors.delete(stale)
+            bm25_remove_ids.extend(stale)
+            chunks_deleted += len(stale)
+        new_manifest[key] = state["entry"]
+        manifest_dirty = True
+
+    def flush(size: int):
+        nonlocal chunks_embedded, batches, unsaved_batches, manifest_dirty
+        items = batch[:size]
+        del batch[:size]
+        texts = [item[1] for item in items]
+        # Generate embeddings with normalization for better cosine similarity
+        embeddings = get_model().encode(texts, normalize_embeddings=True, batch_size=EMBED_BATCH_SIZE)
+        ids = [item[0] for item in items]
+        # Add to Chroma (upsert overwrites if ID exists)
+        col.upsert(
+            documents=texts,
+            embeddings=embeddings.tolist(),
+            metadatas=[item[2] for item in items],
+            ids=ids
+        )
+        if vectors is not None:
+            vectors.upsert(ids, embeddings)
+        upserted_ids.update(ids)
+        bm25_add_ids.extend(ids)
+        exact_add_embeddings.append(embeddings)
+        bm25_add_texts.extend(texts)
+        chunks_embedded += len(items)
+        batches += 1
+
+        for item in items:
+            state = open_files[item[3]]
+            state["remaining"] -= 1
+            if state["remaining"] == 0:
+                finish_file(item[3])
+        # Checkpoint progress so an interrupted ingest resumes from here
+        unsaved_batches += 1
+        if manifest_dirty and unsaved_batches >= MANIFEST_SAVE_BATCHES:
+            save_manifest(MANIFEST_PATH, new_manifest)
+            unsaved_batches = 0
+            manifest_dirty = False
+        if len(bm25_add_ids) >= BM25_DELTA_MAX:
+            apply_bm25_delta(persist=False)
+        report("embedding")
+
+    if to_parse or removed:
+        try:
+            # Invalidate before touching the collection - even a partial failure changes it
+            _publish(version=_snapshot.version + 1)
+            col = get_collection()
+
+            # Files that disappeared from disk since the last run
+            stale = [cid for entry in removed.values() for cid in entry.get("chunk_ids", [])]
+            if stale:
+                col.delete(ids=stale)
+                if vectors is not None:
+                    vectors.delete(stale)
+                bm25_remove_ids.extend(stale)
+                chunks_deleted += len(stale)
+            files_removed.extend(removed)
+            save_manifest(MANIFEST_PATH, new_manifest)
+
+            parse_start = time.perf_counter()
+            for source, docs, error, timing in parse_sources(to_parse):
+                key = source["key"]
+                entry, stat, sha = file_state[key]
+                file_timings[key] = timing
+                if error is not None:
+                    errors.append(f"Failed to load {key}: {error}")
+                    continue
+
+                doc_ids = []
+                chunk_ids = []
+                for doc in docs:
+                    doc_id = str(doc.get("id"))
+                    title = doc.get("title", "Untitled")
+                    body = doc.get("body", "")
+
+                    for i, chunk in enumerate(chunk_text(body)):
+                        chunk_id = f"{doc_id}_{i}"
+                        batch.append((chunk_id, chunk, {"doc_id": doc_id, "title": title, "chunk_index": i}, key))
+                        chunk_ids.append(chunk_id)
+
+                    doc_ids.append(doc_id)
+                    doc_count += 1
+                    files_processed.append(title)
+                chunk_count += len(chunk_ids)
+
+                open_files[key] = {
+                    "remaining": len(chunk_ids),
+                    "entry": make_entry(stat, sha, CHUNKER_VERSION, EMBEDDING_MODEL_KEY, doc_ids, chunk_ids),
+                    "stale": sorted(set(entry.get("chunk_ids", [])) - set(chunk_ids)) if entry else []
+                }
+                if not chunk_ids:
+                    finish_file(key)
+                report("parsing")
+
+                while len(batch) >= EMBED_BATCH_SIZE:
+                    flush(EMBED_BATCH_SIZE)
+            parse_seconds = time.perf_counter() - parse_start
+
+            if batch:
+                flush(len(batch))
+            # Apply the same delta to BM25 (no full rebuild)
+            apply_bm25_delta(persist=True)
         except Exception as e:
             errors.append(f"Chroma/Embedding Error: {str(e)}")
-        
+            # Whatever reached Chroma before the failure must be visible to BM25 too
+            apply_bm25_delta(persist=True)
+        if vectors is not None:
+            try:
+                vectors.save(corpus_fingerprint(new_manifest))
+            except Exception as e:
+                errors.append(f"HNSW Save Error: {str(e)}")
+
+    if new_manifest != manifest:
+        save_manifest(MANIFEST_PATH, new_manifest)
+    # Runs even when nothing changed: a fresh process (scripts, verify_rag.py) that only
+    # skipped files must still end up with BM25/HNSW/exact loaded. After the manifest
+    # is saved so loaded indexes are checked against (and stamped with) the final state.
+    # The exact index covers e.g. a first ingest or a corpus shrunk back under the limit.
+    init_missing_indexes()
+    if to_parse or removed:
+        # Bump again once the final state is published: anything cached while the
+        # collection was half-updated must not outlive the ingest
+        _publish(version=_snapshot.version + 1)
+    report("done")
+
+    print(f"DEBUG: Ingest processed={len(files_processed)} skipped={len(files_skipped)} "
+          f"removed={len(files_removed)} stale_chunks={chunks_deleted} batches={batches}")
+
     return {
-        "doc_count": doc_count, 
+        "doc_count": doc_count,
         "chunk_count": chunk_count,
+        "chunks_embedded": chunks_embedded,
         "files_processed": files_processed,
+        "files_skipped": files_skipped,
+        "files_removed": files_removed,
+        "chunks_deleted": chunks_deleted,
+        "batches": batches,
+        "parse_seconds": round(parse_seconds, 3),
+        "file_timings": file_timings,
         "errors": errors
     }
 
-def retrieve_docs(query: str, k: int = 3):
+def _encode_queries(queries: List[str]) -> np.ndarray:
+    return get_model().encode(queries, normalize_embeddings=True, batch_size=len(queries)).astype(np.float32)
+
+_query_batcher = EmbeddingBatcher(
+    _encode_queries,
+    max_batch=EMBED_BATCHER_MAX_BATCH,
+    max_wait_ms=EMBED_BATCHER_WAIT_MS
+)
+metrics.register_component("query_embedding_batcher", _query_batcher)
+
+def embed_query(query: str) -> np.ndarray:
+    """Returns the normalized embedding for a query, skipping the model on cache hits."""
+    key = normalize_query(query)
+    embedding = _query_embedding_cache.get(key)
+    if embedding is None:
+        if EMBED_BATCHER_ENABLED:
+            embedding = _query_batcher.encode(query)
+        else:
+            embedding = _encode_queries([query])[0]
+        # Shared between callers via the cache - must never be mutated
+        embedding.flags.writeable = False
+        _query_embedding_cache.set(key, embedding)
+    return embedding
+
+def retrieve_docs(query: str, k: int = 3, exact: Optional[bool] = None, query_embedding: np.ndarray = None):
+    """
+    Vector search. exact=None follows VECTOR_SEARCH_MODE (brute force for small corpora,
+    ANN otherwise); True forces exact search - using a private index if the snapshot has
+    none, so the default path is unaffected - and is the recall baseline for the ANN path;
+    False forces ANN. Pass `query_embedding` if the caller has already embedded the query.
+    """
     # Embed query with normalization
-    m = get_model()
-    query_embedding = m.encode([query], normalize_embeddings=True).tolist()
+    if query_embedding is None:
+        with span("embed"):
+            query_embedding = embed_query(query)
+
+    snapshot = get_snapshot()
+    if exact:
+        index = forced_exact_index()
+    else:
+        index = snapshot.exact if exact is None else None
+    if index is not None:
+        with span("vector_query"):
+            ranked = index.search(query_embedding, k)
+        return _ranked_hits(*ranked)
+    if snapshot.vectors is not None:
+        with span("vector_query"):
+            ranked = snapshot.vectors.search(query_embedding, k)
+        return _ranked_hits(*ranked)
     
     # Search
     col = get_collection()
-    results = col.query(
-        query_embeddings=query_embedding,
-        n_results=k
-    )
+    with span("vector_query"):
+        results = col.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=k
+        )
     
     # Format results
     hits = []
     if results['documents']:
         for i in range(len(results['documents'][0])):
             hits.append({
+                "id": results['ids'][0][i],
                 "text": results['documents'][0][i],
                 "metadata": results['metadatas'][0][i],
                 "distance": results['distances'][0][i] if results['distances'] else None
@@ -213,53 +893,108 @@ def retrieve_docs(query: str, k: int = 3):
             
     return hits
 
-def hybrid_retrieve_docs(query: str, k: int = 5):
-    """Combines BM25 and Vector Search results using Reciprocal Rank Fusion (RRF)."""
-    # 1. Vector Search
-    vector_hits = retrieve_docs(query, k=k*2)
-    
-    # 2. BM25 Search
-    bm25_hits = []
-    if bm25:
-        tokenized_query = query.split()
-        scores = bm25.get_scores(tokenized_query)
-        top_n = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k*2]
-        for i in top_n:
-            if scores[i] > 0:
-                bm25_hits.append({
-                    "text": bm25_chunks[i],
-                    "metadata": bm25_metadatas[i] if i < len(bm25_metadatas) else {},
-                    "score": float(scores[i])
-                })
+def _ranked_hits(ids: List[str], distances: List[float]):
+    """Hits for an in-process search result; same shape as the Chroma path."""
+    by_id = fetch_chunks(ids)
+    return [dict(by_id[cid], distance=dist) for cid, dist in zip(ids, distances) if cid in by_id]
+
+def fetch_chunks(ids: List[str]) -> Dict[str, Dict]:
+    """Fetches text/metadata for chunk ids from Chroma. Returns {id: hit}; missing ids are omitted."""
+    if not ids:
+        return {}
+    fetched = get_collection().get(ids=list(ids), include=["documents", "metadatas"])
+    return {
+        cid: {"id": cid, "text": doc, "metadata": meta or {}}
+        for cid, doc, meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])
+    }
+
+def bm25_search(query: str, k: int, snapshot: RetrievalSnapshot = None) -> List[tuple]:
+    """BM25 leg: [(chunk_id, score)] best first, positive scores only. Touches no chunk text."""
+    # Read the snapshot once; ids and postings below are guaranteed to belong together
+    index = (snapshot or get_snapshot()).bm25
+    if index is None:
+        return []
+    with span("bm25_score"):
+        top_idx, top_scores = index.top_n(tokenize_query(query), k)
+    return [(index.doc_ids[i], score) for i, score in zip(top_idx.tolist(), top_scores.tolist()) if score > 0]
+
+def bm25_retrieve_docs(query: str, k: int = 5):
+    """BM25-only retrieval with full hits (same shape as retrieve_docs, plus 'score')."""
+    ranked = bm25_search(query, k)
+    by_id = fetch_chunks([cid for cid, _ in ranked])
+    return [dict(by_id[cid], score=score) for cid, score in ranked if cid in by_id]
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def hybrid_retrieve_docs(query: str, k: int = 5, timings: Dict = None, query_embedding: np.ndarray = None):
+    """
+    Combines BM25 and Vector Search results using Reciprocal Rank Fusion (RRF).
+    The two legs run concurrently (BM25 on the retrieval leg pool, vector search on the
+    calling thread) and fusion is keyed on chunk ids. Only keyword-only winners need
+    their text fetched afterwards. If `timings` is given it is filled with per-leg ms.
+    `query_embedding` is passed on to the vector leg (see retrieve_docs).
+    """
+    start = time.perf_counter()
+    snapshot = get_snapshot()
+
+    # 1. + 2. Vector and BM25 legs in parallel (the copied context carries the trace)
+    bm25_future = _retrieval_leg_pool.submit(contextvars.copy_context().run, _timed, bm25_search, query, k*2, snapshot)
+    vector_hits, vector_ms = _timed(retrieve_docs, query, k*2, None, query_embedding)
+    bm25_ranked, bm25_ms = bm25_future.result()
 
     # 3. RRF Combination
     # RRF Score = sum(1 / (k + rank))
+    fusion_start = time.perf_counter()
     rrf_k = 60
-    scores = {} # text -> score
-    doc_map = {} # text -> full hit object
+    scores = {} # chunk id -> score
+    doc_map = {} # chunk id -> full hit object
     
     # Vector ranks
     for rank, hit in enumerate(vector_hits):
-        txt = hit["text"]
-        scores[txt] = scores.get(txt, 0) + 1.0 / (rrf_k + rank + 1)
-        doc_map[txt] = hit
+        cid = hit["id"]
+        scores[cid] = scores.get(cid, 0) + 1.0 / (rrf_k + rank + 1)
+        doc_map[cid] = hit
         
     # BM25 ranks
-    for rank, hit in enumerate(bm25_hits):
-        txt = hit["text"]
-        scores[txt] = scores.get(txt, 0) + 1.0 / (rrf_k + rank + 1)
-        if txt not in doc_map:
-             doc_map[txt] = hit
-             # Ensure distances/scores are normalized later
-             doc_map[txt]["distance"] = 0.5 # Default middle for keyword hits
+    bm25_scores = {}
+    for rank, (cid, score) in enumerate(bm25_ranked):
+        scores[cid] = scores.get(cid, 0) + 1.0 / (rrf_k + rank + 1)
+        bm25_scores[cid] = score
 
     # Sort by RRF score
-    sorted_texts = sorted(scores.keys(), key=lambda t: scores[t], reverse=True)
+    top_ids = sorted(scores.keys(), key=lambda c: scores[c], reverse=True)[:k]
+    fusion_ms = (time.perf_counter() - fusion_start) * 1000
+    record_span("fusion", fusion_start)
+
+    # Keyword-only hits: fetch text for the winners only
+    fetch_start = time.perf_counter()
+    with span("fetch"):
+        fetched = fetch_chunks([cid for cid in top_ids if cid not in doc_map])
+    for cid, hit in fetched.items():
+        hit["score"] = bm25_scores[cid]
+        # Ensure distances/scores are normalized later
+        hit["distance"] = 0.5 # Default middle for keyword hits
+        doc_map[cid] = hit
+    fetch_ms = (time.perf_counter() - fetch_start) * 1000
     
     results = []
-    for txt in sorted_texts[:k]:
-        hit = doc_map[txt]
-        hit["rrf_score"] = scores[txt]
+    for cid in top_ids:
+        hit = doc_map.get(cid)
+        if hit is None:
+            continue # deleted between BM25 scoring and fetch
+        hit["rrf_score"] = scores[cid]
         results.append(hit)
+
+    if timings is not None:
+        timings.update({
+            "vector_ms": round(vector_ms, 2),
+            "bm25_ms": round(bm25_ms, 2),
+            "fusion_ms": round(fusion_ms, 2),
+            "fetch_ms": round(fetch_ms, 2),
+            "retrieval_ms": round((time.perf_counter() - start) * 1000, 2)
+        })
         
     return results
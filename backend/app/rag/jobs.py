@@ -0,0 +1,139 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app.rag.engine import ingest_docs
+from app.core.metrics import metrics
+
+# Finished jobs kept for status lookups
+MAX_JOB_HISTORY = 50
+
+
+class IngestJob:
+    def __init__(self, force: bool = False):
+        self.id = str(uuid.uuid4())
+        self.force = force
+        self.status = "queued"  # queued -> running -> completed | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+
+    def update_progress(self, progress: dict):
+        self.progress = progress
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or now) - self.started_at
+
+        p = self.progress
+        throughput = {}
+        eta_seconds = None
+        if elapsed:
+            throughput = {
+                "docs_per_second": round(p.get("docs_parsed", 0) / elapsed, 2),
+                "chunks_per_second": round(p.get("chunks_embedded", 0) / elapsed, 2)
+            }
+            if self.status == "running":
+                eta_seconds = self._eta(elapsed)
+
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "force": self.force,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(elapsed, 2) if elapsed is not None else None,
+            "progress": p,
+            "throughput": throughput,
+            "eta_seconds": eta_seconds,
+            "result": self.result,
+            "error": self.error
+        }
+
+    def _eta(self, elapsed: float):
+        """Estimates remaining time from the fraction of work done so far."""
+        p = self.progress
+        files_total = p.get("files_total", 0)
+        if not files_total:
+            return None
+        # Parsing is known per file; embedding is known per chunk for the files parsed so far
+        parsed = p.get("files_parsed", 0) / files_total
+        chunks_total = p.get("chunks_total", 0)
+        embedded = p.get("chunks_embedded", 0) / chunks_total if chunks_total else 0
+        done = parsed * embedded if chunks_total else parsed
+        if done <= 0:
+            return None
+        return round(elapsed * (1 - done) / done, 1)
+
+
+class IngestJobManager:
+    """
+    Runs ingestion jobs in the background, one at a time.
+    A single worker thread executes jobs in submission order; submitting while a job
+    is already queued returns that job instead of stacking up duplicate ingests.
+    """
+
+    def __init__(self, ingest_fn):
+        self._ingest_fn = ingest_fn
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, force: bool = False) -> IngestJob:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == "queued" and job.force == force:
+                    return job
+            job = IngestJob(force=force)
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        return [job.to_dict() for job in reversed(list(self._jobs.values()))]
+
+    def active(self):
+        """The running job, if any."""
+        for job in self._jobs.values():
+            if job.status == "running":
+                return job
+        return None
+
+    def _trim(self):
+        finished = [jid for jid, job in self._jobs.items() if job.status in ("completed", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - MAX_JOB_HISTORY)]:
+            del self._jobs[jid]
+
+    def _run(self, job: IngestJob):
+        job.status = "running"
+        job.started_at = time.time()
+        print(f"DEBUG: Ingest job {job.id} started (force={job.force})")
+        try:
+            # Per-file errors are reported in result["errors"]; only a crash fails the job
+            job.result = self._ingest_fn(force=job.force, progress=job.update_progress)
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            print(f"DEBUG: Ingest job {job.id} {job.status} in {job.finished_at - job.started_at:.2f}s")
+            # Totals for /metrics - throughput is rate(chunks) / rate(seconds) on the scraper side
+            metrics.increment(f"ingest_jobs_{job.status}")
+            metrics.increment("ingest_seconds", job.finished_at - job.started_at)
+            metrics.increment("ingest_chunks_embedded", job.progress.get("chunks_embedded", 0))
+            metrics.increment("ingest_docs", job.progress.get("docs_parsed", 0))
+
+
+ingest_jobs = IngestJobManager(ingest_docs)
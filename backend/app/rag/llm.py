@@ -6,8 +6,14 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from app.rag.engine import hybrid_retrieve_docs
+from app.rag.engine import hybrid_retrieve_docs, embed_query, get_corpus_version
+from app.rag.cache import SemanticAnswerCache
+from app.rag.rerank import rerank_chunks
+from app.rag.context import build_context, CONTEXT_MAX_CHUNKS
+from app.rag.llm_client import LLMClient, LLM_BASE_URL, make_http_clients, http_timeout
 from app.core.metrics import metrics
+from app.core.concurrency import run_cpu
+from app.core.tracing import start_trace, finish_trace, span, record_span
 import uuid
 
 # Load env vars - using absolute path for robustness in all environments
@@ -31,14 +37,22 @@ def get_llm():
         print("CRITICAL: HUGGINGFACE_API_KEY not found in .env!")
         return None
     try:
-        # Using the standard HF Router for OpenAI compatibility
+        # Using the standard HF Router (or LLM_BASE_URL) for OpenAI compatibility.
+        # Retries are done by LLMClient so they count against the in-flight limit.
+        http_client, http_async_client = make_http_clients()
         _llm = ChatOpenAI(
-            base_url="https://router.huggingface.co/v1/",
+            base_url=LLM_BASE_URL,
             api_key=HF_TOKEN,
             model=REPO_ID,
-            temperature=0.1
+            temperature=0.1,
+            timeout=http_timeout(),
+            max_retries=0,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
-        return _llm
+        client = LLMClient(_llm)
+        metrics.register_component("llm", client)
+        return client
     except Exception as e:
         print(f"ERROR: LLM Init failed: {e}")
         return None
@@ -70,36 +84,24 @@ Question:
 prompt_context = PromptTemplate(template=template_with_context, input_variables=["context", "question"])
 prompt_general = PromptTemplate(template=template_no_context, input_variables=["question"])
 
-def generate_answer(query: str):
-    start_time = time.time()
-    trace_id = str(uuid.uuid4())
-    print(f"\n--- RAG ASK [{trace_id}]: {query} ---")
-    
-    if not llm:
-        return {
-            "answer": "Error: LLM not initialized.",
-            "status": "error",
-            "trace_id": trace_id,
-            "sources": []
-        }
+# Semantic answer cache - skips the LLM for near-identical questions over the same context
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
 
-    # 1. RETRIEVE (HYBRID)
-    try:
-        print(f"DEBUG: Starting retrieval for '{query}'...")
-        r_start = time.time()
-        # Request k=7 for more candidates
-        chunks = hybrid_retrieve_docs(query, k=7)
-        print(f"DEBUG: Retrieval took {time.time() - r_start:.2f}s")
-    except Exception as e:
-        print(f"ERROR: Retrieval failed: {e}")
-        metrics.log_request("error", time.time() - start_time)
-        return {"answer": f"Error in retrieval: {e}", "status": "error", "trace_id": trace_id, "sources": []}
-    
-    # 2. CONFIDENCE CHECK (GUARDRAILS)
-    # Lowered threshold for better coverage of PDF content
-    REVISED_THRESHOLD = 0.40
-    REVISED_MIN_CHUNKS = 1
-    
+answer_cache = SemanticAnswerCache(
+    maxsize=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    threshold=ANSWER_CACHE_SIMILARITY
+)
+metrics.register_cache("answer", answer_cache)
+
+# Lowered threshold for better coverage of PDF content
+REVISED_THRESHOLD = 0.40
+REVISED_MIN_CHUNKS = 1
+
+def apply_guardrails(chunks):
+    """Confidence check. Returns (relevant_chunks, top_score, status)."""
     relevant_chunks = []
     top_score = 0.0
     
@@ -125,59 +127,291 @@ def generate_answer(query: str):
         print(f"DEBUG: Guardrails triggered. {explanation}")
         # Note: We continue to allow fallback generation
 
+    return relevant_chunks, top_score, status
+
+def build_prompt(query: str, status: str, relevant_chunks):
+    """Returns (prompt, the chunks that made it into the prompt)."""
+    if status == "low_context":
+        # REVISED REQUIREMENT: "provide low context info" if out of context
+        print(f"DEBUG: Generating general answer (Low Context)...")
+        return prompt_general.format(question=query), []
+
+    print(f"DEBUG: Generating context-based answer...")
+    # Top chunks up to the token budget, with chunk overlaps removed and neighbours merged
+    context_text, used = build_context(relevant_chunks[:CONTEXT_MAX_CHUNKS])
+    return prompt_context.format(context=context_text, question=query), used
+
+def format_sources(context_chunks):
+    """Calculate sources for final output (the chunks the prompt was built from)."""
+    final_sources = []
+    for chunk in context_chunks:
+        source_item = chunk.copy()
+        # Ensure title is extracted from metadata for UI
+        if "title" not in source_item and "metadata" in chunk:
+            source_item["title"] = chunk["metadata"].get("title", "Unknown Source")
+        
+        # Ensure score is present for UI
+        if "score" not in source_item:
+             if "distance" in chunk and chunk["distance"] is not None:
+                 source_item["score"] = 1 - chunk["distance"]
+             elif "rrf_score" in chunk:
+                 source_item["score"] = chunk["rrf_score"]
+             else:
+                 source_item["score"] = 0.8
+        final_sources.append(source_item)
+    return final_sources
+
+def answer_cache_key(query_embedding, status: str, context_chunks):
+    """(query embedding, context key, corpus version) for the semantic answer cache."""
+    # Context key: the exact set of chunks that went into the prompt, plus which prompt is used
+    context_key = (status, tuple(sorted(str(c.get("id")) for c in context_chunks)))
+    return query_embedding, context_key, get_corpus_version()
+
+def prepare_answer(query: str, trace_id: str, start_time: float) -> dict:
+    """
+    Everything before the LLM call, shared by every answer path:
+    retrieve (hybrid) -> guardrails -> rerank -> prompt -> answer cache.
+
+    All of it is blocking CPU work, so the async paths run it on the CPU executor in one
+    hop. The query is embedded once here and reused for retrieval and the cache key.
+    Returns a dict with "error" set if retrieval failed, "cached" set on an answer cache
+    hit, and otherwise the "prompt" to send; "context_chunks" are the chunks in the prompt.
+    """
+    prepared = {"trace_id": trace_id, "start_time": start_time, "error": None, "cached": None, "chunks": []}
+
+    # 1. RETRIEVE (HYBRID)
+    try:
+        print(f"DEBUG: Starting retrieval for '{query}'...")
+        r_start = time.time()
+        timings = {}
+        embed_start = time.perf_counter()
+        with span("embed"):
+            query_embedding = embed_query(query)
+        timings["embed_ms"] = round((time.perf_counter() - embed_start) * 1000, 2)
+        # Request k=7 for more candidates
+        chunks = hybrid_retrieve_docs(query, k=7, timings=timings, query_embedding=query_embedding)
+        print(f"DEBUG: Retrieval took {time.time() - r_start:.2f}s {timings}")
+    except Exception as e:
+        print(f"ERROR: Retrieval failed: {e}")
+        metrics.log_request("error", time.time() - start_time)
+        prepared["error"] = f"Error in retrieval: {e}"
+        return prepared
+
+    # 2. CONFIDENCE CHECK (GUARDRAILS) + optional cross-encoder rerank
+    with span("guardrail"):
+        relevant_chunks, top_score, status = apply_guardrails(chunks)
+    relevant_chunks = rerank_chunks(query, relevant_chunks, timings=timings)
+    metrics.observe_timings(timings)
+
+    # The prompt is built before the cache lookup: the cache is keyed on the chunks that
+    # survived the token budget, not on the retrieval order
+    with span("prompt_build"):
+        prompt, context_chunks = build_prompt(query, status, relevant_chunks)
+    cache_key = answer_cache_key(query_embedding, status, context_chunks)
+    with span("answer_cache"):
+        cached = answer_cache.get(*cache_key)
+    prepared.update(chunks=chunks, context_chunks=context_chunks, top_score=top_score, status=status,
+                    prompt=prompt, cache_key=cache_key, cached=cached)
+    return prepared
+
+def check_answer_status(status: str, answer: str) -> str:
+    # Guardrail check for context-based answer
+    if status == "success" and "I don't have enough information" in answer:
+        return "low_context_fallback"
+    return status
+
+def finish_answer(prepared: dict, answer: str, g_start: float) -> str:
+    """Post-LLM bookkeeping shared by every path. Returns the final status."""
+    print(f"DEBUG: Generation took {time.time() - g_start:.2f}s")
+    metrics.observe("llm", time.time() - g_start)
+    status = check_answer_status(prepared["status"], answer)
+    answer_cache.set(*prepared["cache_key"], {"answer": answer, "status": status})
+    metrics.log_request(status, time.time() - prepared["start_time"], prepared["top_score"])
+    return status
+
+def early_response(prepared: dict):
+    """Response without an LLM call (retrieval error or answer cache hit), or None."""
+    trace_id = prepared["trace_id"]
+    if prepared["error"]:
+        return {"answer": prepared["error"], "status": "error", "trace_id": trace_id, "sources": []}
+    cached = prepared["cached"]
+    if cached is None:
+        return None
+    latency = time.time() - prepared["start_time"]
+    print(f"DEBUG: Answer cache hit ({latency * 1000:.1f}ms)")
+    metrics.log_request(cached["status"], latency, prepared["top_score"])
+    return {
+        "answer": cached["answer"],
+        "status": cached["status"],
+        "trace_id": trace_id,
+        "sources": format_sources(prepared["context_chunks"]),
+        "cached": True
+    }
+
+def answer_response(prepared: dict, answer: str, g_start: float) -> dict:
+    status = finish_answer(prepared, answer, g_start)
+    return {
+        "answer": answer,
+        "status": status,
+        "trace_id": prepared["trace_id"],
+        "sources": format_sources(prepared["context_chunks"])
+    }
+
+def generation_error(prepared: dict, e: Exception) -> dict:
+    metrics.log_request("error", time.time() - prepared["start_time"], prepared["top_score"])
+    return {
+        "answer": f"Error generating answer: {str(e)}",
+        "status": "error",
+        "trace_id": prepared["trace_id"],
+        "sources": prepared["chunks"]
+    }
+
+def llm_unavailable(trace_id: str) -> dict:
+    return {
+        "answer": "Error: LLM not initialized.",
+        "status": "error",
+        "trace_id": trace_id,
+        "sources": []
+    }
+
+def traced_result(result: dict, trace, include_trace: bool) -> dict:
+    finish_trace(trace, result["status"])
+    if include_trace:
+        result["trace"] = trace.to_dict()
+    return result
+
+def traced_event(event: str, data: dict, trace, include_trace: bool):
+    """Finishes the trace on the terminal event and optionally attaches it there."""
+    if event in ("done", "error"):
+        finish_trace(trace, data.get("status", event))
+        if include_trace:
+            data = dict(data, trace=trace.to_dict())
+    return event, data
+
+def generate_answer(query: str, include_trace: bool = False):
+    """Answers a query (retrieve -> guardrails -> LLM). include_trace adds the per-stage spans."""
+    trace = start_trace(str(uuid.uuid4()), "ask", query=query)
+    return traced_result(_generate_answer(query, trace.trace_id), trace, include_trace)
+
+def _generate_answer(query: str, trace_id: str):
+    start_time = time.time()
+    print(f"\n--- RAG ASK [{trace_id}]: {query} ---")
+    if not llm:
+        return llm_unavailable(trace_id)
+
+    prepared = prepare_answer(query, trace_id, start_time)
+    response = early_response(prepared)
+    if response is not None:
+        return response
+
     # 3. GENERATE
     try:
-        if status == "low_context":
-            # REVISED REQUIREMENT: "provide low context info" if out of context
-            print(f"DEBUG: Generating general answer (Low Context)...")
-            formatted_prompt = prompt_general.format(question=query)
-        else:
-            print(f"DEBUG: Generating context-based answer...")
-            # Use top 5 chunks for more context
-            context_text = "\n\n".join([c["text"] for c in relevant_chunks[:5]])
-            formatted_prompt = prompt_context.format(context=context_text, question=query)
+        g_start = time.time()
+        with span("llm"):
+            response = llm.invoke(prepared["prompt"])
+        return answer_response(prepared, response.content.strip(), g_start)
+    except Exception as e:
+        return generation_error(prepared, e)
+
+async def agenerate_answer(query: str, include_trace: bool = False):
+    """
+    Async variant of generate_answer for the API routes.
+    The pre-LLM stage runs on the bounded CPU executor and the LLM call is awaited with
+    ainvoke, so a pending LLM request holds no thread at all.
+    """
+    trace = start_trace(str(uuid.uuid4()), "ask", query=query)
+    return traced_result(await _agenerate_answer(query, trace.trace_id), trace, include_trace)
+
+async def _agenerate_answer(query: str, trace_id: str):
+    start_time = time.time()
+    print(f"\n--- RAG ASK [{trace_id}]: {query} ---")
+    if not llm:
+        return llm_unavailable(trace_id)
+
+    prepared = await run_cpu(prepare_answer, query, trace_id, start_time)
+    response = early_response(prepared)
+    if response is not None:
+        return response
 
+    # 3. GENERATE
+    try:
         g_start = time.time()
-        response = llm.invoke(formatted_prompt)
-        answer = response.content.strip()
-        print(f"DEBUG: Generation took {time.time() - g_start:.2f}s")
-        
-        # Guardrail check for context-based answer
-        if status == "success" and "I don't have enough information" in answer:
-             status = "low_context_fallback"
-
-        # Calculate sources for final output
-        final_sources = []
-        for chunk in relevant_chunks[:5]:
-            source_item = chunk.copy()
-            # Ensure title is extracted from metadata for UI
-            if "title" not in source_item and "metadata" in chunk:
-                source_item["title"] = chunk["metadata"].get("title", "Unknown Source")
-            
-            # Ensure score is present for UI
-            if "score" not in source_item:
-                 if "distance" in chunk and chunk["distance"] is not None:
-                     source_item["score"] = 1 - chunk["distance"]
-                 elif "rrf_score" in chunk:
-                     source_item["score"] = chunk["rrf_score"]
-                 else:
-                     source_item["score"] = 0.8
-            final_sources.append(source_item)
-
-        latency = time.time() - start_time
-        metrics.log_request(status, latency, top_score)
-        
-        return {
-            "answer": answer,
-            "status": status,
+        with span("llm"):
+            response = await llm.ainvoke(prepared["prompt"])
+        return answer_response(prepared, response.content.strip(), g_start)
+    except Exception as e:
+        return generation_error(prepared, e)
+
+async def astream_answer(query: str, include_trace: bool = False):
+    """
+    Streaming variant of agenerate_answer. Yields (event, data) tuples:
+      sources -> retrieved sources, as soon as retrieval + guardrails finish
+      token   -> each LLM content delta as it arrives
+      done    -> final status, trace_id and latency (+ trace if include_trace)
+      error   -> terminal error (no 'done' follows)
+    """
+    trace = start_trace(str(uuid.uuid4()), "ask_stream", query=query)
+    try:
+        async for event, data in _astream_answer(query, trace.trace_id):
+            yield traced_event(event, data, trace, include_trace)
+    finally:
+        # Client went away mid-stream
+        finish_trace(trace, "cancelled")
+
+async def _astream_answer(query: str, trace_id: str):
+    start_time = time.time()
+    print(f"\n--- RAG ASK STREAM [{trace_id}]: {query} ---")
+    if not llm:
+        yield "error", {"message": "Error: LLM not initialized.", "status": "error", "trace_id": trace_id}
+        return
+
+    prepared = await run_cpu(prepare_answer, query, trace_id, start_time)
+    response = early_response(prepared)
+    if response is not None:
+        if response["status"] == "error":
+            yield "error", {"message": response["answer"], "status": "error", "trace_id": trace_id}
+            return
+        # Answer cache hit - replay it as a one-token stream
+        yield "sources", {"trace_id": trace_id, "status": response["status"], "sources": response["sources"]}
+        yield "token", {"content": response["answer"]}
+        latency_ms = round((time.time() - start_time) * 1000, 2)
+        yield "done", {
+            "status": response["status"],
             "trace_id": trace_id,
-            "sources": final_sources
+            "latency_ms": latency_ms,
+            "first_token_ms": latency_ms,
+            "cached": True
         }
-    except Exception as e:
-        metrics.log_request("error", time.time() - start_time, top_score)
-        return {
-            "answer": f"Error generating answer: {str(e)}",
-            "status": "error",
+        return
+
+    yield "sources", {"trace_id": trace_id, "status": prepared["status"],
+                      "sources": format_sources(prepared["context_chunks"])}
+
+    # 3. GENERATE (STREAMING)
+    try:
+        g_start = time.time()
+        llm_start = time.perf_counter()
+        first_token_at = None
+        parts = []
+        async for chunk in llm.astream(prepared["prompt"]):
+            if not chunk.content:
+                continue
+            if first_token_at is None:
+                first_token_at = time.time()
+                print(f"DEBUG: First token after {first_token_at - start_time:.2f}s")
+                metrics.observe("llm_first_token", first_token_at - g_start)
+                record_span("llm_first_token", llm_start)
+            parts.append(chunk.content)
+            yield "token", {"content": chunk.content}
+        record_span("llm", llm_start)
+
+        status = finish_answer(prepared, "".join(parts).strip(), g_start)
+        yield "done", {
+            "status": status,
             "trace_id": trace_id,
-            "sources": chunks
+            "latency_ms": round((time.time() - start_time) * 1000, 2),
+            "first_token_ms": round((first_token_at - start_time) * 1000, 2) if first_token_at else None
         }
+    except Exception as e:
+        generation_error(prepared, e)
+        yield "error", {"message": f"Error generating answer: {str(e)}", "status": "error", "trace_id": trace_id}
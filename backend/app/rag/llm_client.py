@@ -0,0 +1,233 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import httpx
+import openai
+
+# LLM endpoint - any OpenAI-compatible server (e.g. scripts/llm_stub_server.py for load tests)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://router.huggingface.co/v1/")
+
+# Shared keep-alive connection pool: one TLS handshake per connection, not per request
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# Per-request timeouts (seconds). The read timeout bounds the gap between streamed tokens.
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+# At most this many LLM calls in flight; the rest wait (queue depth is reported in metrics)
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+
+# Retries on 429/5xx/connection errors, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+
+def http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def make_http_clients():
+    """(sync, async) httpx clients sharing the pool settings, for ChatOpenAI(http_client=...)."""
+    return (
+        httpx.Client(limits=http_limits(), timeout=http_timeout()),
+        httpx.AsyncClient(limits=http_limits(), timeout=http_timeout())
+    )
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # APITimeoutError is a subclass of APIConnectionError
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError))
+
+
+def retry_delay(error: Exception, attempt: int, base: float, cap: float) -> float:
+    """Full jitter, but a server-sent Retry-After (seconds) is honoured up to `cap`."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LLMClient:
+    """
+    Wraps a LangChain chat model with a max-in-flight limit, retries and queue metrics.
+    Exposes the same invoke/ainvoke/stream/astream calls the answer paths already use.
+
+    Sync and async callers wait on separate semaphores of LLM_MAX_IN_FLIGHT each (a
+    threading semaphore would block the event loop); the API only uses the async path.
+    A stream holds its slot until it finishes and is only retried before its first chunk.
+    """
+
+    def __init__(self, model, max_in_flight: int = LLM_MAX_IN_FLIGHT, max_retries: int = LLM_MAX_RETRIES,
+                 base_delay: float = LLM_RETRY_BASE_DELAY, max_delay: float = LLM_RETRY_MAX_DELAY):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sync_slots = threading.BoundedSemaphore(max_in_flight)
+        self._async_slots = None  # created on first use, inside the running loop
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # --- Bookkeeping ---
+
+    def _queued(self):
+        with self._lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+        return time.perf_counter()
+
+    def _started(self, queued_at: float):
+        waited = time.perf_counter() - queued_at
+        with self._lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.requests += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def _finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        retry = attempt < self.max_retries and is_retryable(error)
+        with self._lock:
+            if getattr(error, "status_code", None) == 429:
+                self.rate_limited += 1
+            if retry:
+                self.retries += 1
+            else:
+                self.failures += 1
+        if retry:
+            print(f"DEBUG: LLM call failed ({type(error).__name__}), retry {attempt + 1}/{self.max_retries}")
+        return retry
+
+    def _delay(self, error: Exception, attempt: int) -> float:
+        return retry_delay(error, attempt, self.base_delay, self.max_delay)
+
+    def _async_semaphore(self) -> asyncio.Semaphore:
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_in_flight)
+        return self._async_slots
+
+    # --- Calls ---
+
+    def invoke(self, prompt):
+        queued_at = self._queued()
+        with self._sync_slots:
+            self._started(queued_at)
+            try:
+                attempt = 0
+                while True:
+                    try:
+                        return self.model.invoke(prompt)
+                    except Exception as e:
+                        if not self._should_retry(e, attempt):
+                            raise
+                        time.sleep(self._delay(e, attempt))
+                        attempt += 1
+            finally:
+                self._finished()
+
+    async def ainvoke(self, prompt):
+        queued_at = self._queued()
+        async with self._async_semaphore():
+            self._started(queued_at)
+            try:
+                attempt = 0
+                while True:
+                    try:
+                        return await self.model.ainvoke(prompt)
+                    except Exception as e:
+                        if not self._should_retry(e, attempt):
+                            raise
+                        await asyncio.sleep(self._delay(e, attempt))
+                        attempt += 1
+            finally:
+                self._finished()
+
+    def stream(self, prompt):
+        queued_at = self._queued()
+        with self._sync_slots:
+            self._started(queued_at)
+            try:
+                attempt = 0
+                while True:
+                    started = False
+                    try:
+                        for chunk in self.model.stream(prompt):
+                            started = True
+                            yield chunk
+                        return
+                    except Exception as e:
+                        if started or not self._should_retry(e, attempt):
+                            raise
+                        time.sleep(self._delay(e, attempt))
+                        attempt += 1
+            finally:
+                self._finished()
+
+    async def astream(self, prompt):
+        queued_at = self._queued()
+        async with self._async_semaphore():
+            self._started(queued_at)
+            try:
+                attempt = 0
+                while True:
+                    started = False
+                    try:
+                        async for chunk in self.model.astream(prompt):
+                            started = True
+                            yield chunk
+                        return
+                    except Exception as e:
+                        if started or not self._should_retry(e, attempt):
+                            raise
+                        await asyncio.sleep(self._delay(e, attempt))
+                        attempt += 1
+            finally:
+                self._finished()
+
+    def stats(self) -> dict:
+        return {
+            "base_url": LLM_BASE_URL,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peak_waiting,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "avg_queue_wait_ms": round(self.total_wait / self.requests * 1000, 2) if self.requests else 0,
+            "max_queue_wait_ms": round(self.max_wait * 1000, 2)
+        }
@@ -0,0 +1,81 @@
+import os
+import json
+import hashlib
+from typing import Dict
+
+# Manifest format version - bump if the entry layout below changes
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """Hashes a file in fixed-size blocks so large PDFs are never fully in memory."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, Dict]:
+    """Returns {source_key: entry}. A missing or unreadable manifest means 'nothing ingested yet'."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            print(f"DEBUG: Ignoring manifest with version {data.get('version')}")
+            return {}
+        return data.get("files", {})
+    except Exception as e:
+        print(f"ERROR: Failed to read ingest manifest {path}: {e}")
+        return {}
+
+
+def save_manifest(path: str, files: Dict[str, Dict]):
+    """Writes the manifest atomically so a crash mid-write never leaves a truncated file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def make_entry(stat: os.stat_result, sha256: str, chunker_version: str,
+               embedding_model: str, doc_ids, chunk_ids) -> Dict:
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": sha256,
+        "chunker_version": chunker_version,
+        "embedding_model": embedding_model,
+        "doc_ids": list(doc_ids),
+        "chunk_ids": list(chunk_ids),
+    }
+
+
+def corpus_fingerprint(files: Dict[str, Dict]) -> str:
+    """
+    Hash of what the manifest says is in the collection (per file: content hash, chunker,
+    model and chunk ids). Derived indexes store it so a copy built from another corpus
+    state is detected even when the chunk count happens to match.
+    """
+    h = hashlib.sha256()
+    for key in sorted(files):
+        entry = files[key]
+        h.update(json.dumps([key, entry.get("sha256"), entry.get("chunker_version"),
+                             entry.get("embedding_model"), entry.get("chunk_ids", [])]).encode())
+    return h.hexdigest()
+
+
+def same_pipeline(entry: Dict, chunker_version: str, embedding_model: str) -> bool:
+    """True if the entry was produced by the current chunker and embedding model."""
+    return (
+        entry.get("chunker_version") == chunker_version
+        and entry.get("embedding_model") == embedding_model
+    )
+
+
+def stat_unchanged(entry: Dict, stat: os.stat_result) -> bool:
+    """Cheap check: same size and mtime means we can skip hashing entirely."""
+    return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
@@ -0,0 +1,31 @@
+import time
+from typing import List, Tuple
+from pypdf import PdfReader
+
+# Kept free of heavy imports (torch, chromadb): this module is imported by every
+# ingestion worker process.
+
+
+def page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def page_ranges(n_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    """Splits [0, n_pages) into consecutive (start, end) ranges of at most pages_per_task."""
+    return [(start, min(start + pages_per_task, n_pages)) for start in range(0, n_pages, pages_per_task)]
+
+
+def extract_pages(path: str, start: int, end: int) -> Tuple[List[str], float]:
+    """Extracts text for pages [start, end). Returns (non-empty page texts, seconds spent)."""
+    t0 = time.perf_counter()
+    reader = PdfReader(path)
+    texts = []
+    for page in reader.pages[start:end]:
+        extracted = page.extract_text()
+        if extracted:
+            texts.append(extracted)
+    return texts, time.perf_counter() - t0
+
+
+def join_pages(texts: List[str]) -> str:
+    return "".join(t + "\n" for t in texts)
@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+from typing import Dict, List
+from app.rag.cache import TTLCache, normalize_query
+from app.rag.engine import get_corpus_version
+from app.core.metrics import metrics
+from app.core.tracing import span
+
+# Optional cross-encoder reranking between retrieval and generation. Retrieval still
+# fetches k=7 candidates; the cross-encoder scores every (query, chunk) pair jointly and
+# only the best RERANK_TOP_N go into the prompt - fewer, better chunks, shorter prompts.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_ID = os.getenv("RERANK_MODEL_ID", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+
+# (query, chunk_id, corpus version) -> score; repeated questions skip the model entirely
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "8192"))
+RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", "3600"))
+
+_score_cache = TTLCache(maxsize=RERANK_CACHE_SIZE, ttl=RERANK_CACHE_TTL)
+metrics.register_cache("rerank_score", _score_cache)
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_reranker():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                print(f"Loading Reranker {RERANK_MODEL_ID}...")
+                _model = CrossEncoder(RERANK_MODEL_ID, device="cpu")
+                print("Reranker Loaded")
+    return _model
+
+def warmup_reranker() -> float:
+    """Loads the cross-encoder and runs one batch through it. Returns seconds taken."""
+    start = time.perf_counter()
+    if RERANK_ENABLED:
+        get_reranker().predict([("warm up query", "warm up passage")] * 4, batch_size=RERANK_BATCH_SIZE)
+    return time.perf_counter() - start
+
+def score_chunks(query: str, chunks: List[Dict]) -> List[float]:
+    """Cross-encoder relevance for each chunk. Cached pairs are reused; the rest go in one batch."""
+    query_key = normalize_query(query)
+    version = get_corpus_version()
+    keys = [(query_key, str(c.get("id")), version) for c in chunks]
+    scores = [_score_cache.get(key) for key in keys]
+
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        pairs = [(query, chunks[i]["text"]) for i in missing]
+        predicted = get_reranker().predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+        for i, score in zip(missing, predicted.tolist()):
+            scores[i] = score
+            _score_cache.set(keys[i], score)
+    return scores
+
+def rerank_chunks(query: str, chunks: List[Dict], top_n: int = RERANK_TOP_N, timings: Dict = None) -> List[Dict]:
+    """
+    Reorders chunks by cross-encoder score (best first, adds 'rerank_score') and keeps
+    the top_n. Returns chunks unchanged when reranking is disabled.
+    """
+    if not RERANK_ENABLED or not chunks:
+        return chunks
+    start = time.perf_counter()
+    try:
+        with span("rerank"):
+            scores = score_chunks(query, chunks)
+    except Exception as e:
+        # A broken reranker must not fail the request - fall back to retrieval order
+        print(f"ERROR: Rerank failed: {e}")
+        return chunks
+    order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)[:top_n]
+    reranked = [dict(chunks[i], rerank_score=scores[i]) for i in order]
+    if timings is not None:
+        timings["rerank_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return reranked
@@ -0,0 +1,254 @@
+import os
+import json
+import shutil
+import threading
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+# In-process HNSW vector index (VECTOR_BACKEND=hnsw). Requires `pip install hnswlib`.
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF = int(os.getenv("HNSW_EF", "64"))
+
+# Exact search matrix dtype. float16 halves memory, but NumPy has no float16 BLAS, so rows
+# are upcast block by block at query time (~4x slower than float32 - measure before use)
+EXACT_SEARCH_DTYPE = os.getenv("EXACT_SEARCH_DTYPE", "float32")
+EXACT_SEARCH_BLOCK = 4096
+
+# On-disk format version - bump if the files written by HnswVectorStore.save change
+STORE_FORMAT_VERSION = 1
+
+
+def _import_hnswlib():
+    try:
+        import hnswlib
+        return hnswlib
+    except ImportError:
+        raise RuntimeError("VECTOR_BACKEND=hnsw requires hnswlib: pip install hnswlib")
+
+
+class HnswVectorStore:
+    """
+    HNSW index over a memory-mapped float32 embedding matrix.
+
+    Row `label` of embeddings.npy holds the vector for chunk ids[label]; the same label
+    is used inside the HNSW graph. Deleted chunks are tombstoned in the graph and their
+    labels reused by later inserts, so the matrix does not grow with churn. The matrix
+    is the durable copy of the vectors (rebuilds/exact search never go back to Chroma);
+    text and metadata stay in Chroma and are fetched by id for the final hits.
+
+    Writes and queries share one lock: hnswlib cannot search while it resizes, and a
+    query is ~100us so contention is negligible next to the rest of the request.
+    """
+
+    def __init__(self, path: str, dim: int, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION,
+                 ef: int = HNSW_EF):
+        self.path = path
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.ids: List[str] = []  # label -> chunk id (None for a free label)
+        self.labels: Dict[str, int] = {}  # chunk id -> label
+        self.free_labels: List[int] = []
+        self.fingerprint = None  # corpus fingerprint stored with a saved store (set by load)
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.index = None
+        self._lock = threading.Lock()
+
+    # --- Construction / persistence ---
+
+    def _new_index(self, capacity: int):
+        hnswlib = _import_hnswlib()
+        index = hnswlib.Index(space="cosine", dim=self.dim)
+        index.init_index(max_elements=max(capacity, 16), M=self.m, ef_construction=self.ef_construction)
+        index.set_ef(self.ef)
+        return index
+
+    @classmethod
+    def build(cls, path: str, ids: List[str], embeddings: np.ndarray, **params) -> "HnswVectorStore":
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        store = cls(path, embeddings.shape[1], **params)
+        store.index = store._new_index(len(ids))
+        store.upsert(ids, embeddings)
+        return store
+
+    def save(self, fingerprint: str = None):
+        """
+        Writes graph, matrix and id map to a temp dir that is swapped in with a rename.
+        `fingerprint` identifies the corpus state it was built from (see corpus_fingerprint).
+        """
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            self.index.save_index(os.path.join(tmp_path, "index.bin"))
+            np.save(os.path.join(tmp_path, "embeddings.npy"), np.ascontiguousarray(self.matrix[:len(self.ids)]))
+            with open(os.path.join(tmp_path, "ids.json"), "w", encoding="utf-8") as f:
+                json.dump(self.ids, f)
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": STORE_FORMAT_VERSION, "dim": self.dim, "m": self.m,
+                    "ef_construction": self.ef_construction, "count": len(self.labels),
+                    "fingerprint": fingerprint
+                }, f)
+            self.fingerprint = fingerprint
+
+            old_path = self.path + ".old"
+            shutil.rmtree(old_path, ignore_errors=True)
+            if os.path.exists(self.path):
+                os.rename(self.path, old_path)
+            os.rename(tmp_path, self.path)
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, ef: int = HNSW_EF) -> "HnswVectorStore":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported HNSW store version {meta.get('version')}")
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+
+        store = cls(path, meta["dim"], m=meta["m"], ef_construction=meta["ef_construction"], ef=ef)
+        store.ids = ids
+        store.fingerprint = meta.get("fingerprint")
+        store.labels = {cid: label for label, cid in enumerate(ids) if cid is not None}
+        store.free_labels = [label for label, cid in enumerate(ids) if cid is None]
+        # Read-only map until the first write copies it into memory
+        store.matrix = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+
+        hnswlib = _import_hnswlib()
+        store.index = hnswlib.Index(space="cosine", dim=store.dim)
+        store.index.load_index(os.path.join(path, "index.bin"), max_elements=max(len(ids), 16))
+        store.index.set_ef(ef)
+        return store
+
+    # --- Writes ---
+
+    def _ensure_capacity(self, rows: int):
+        if rows > self.matrix.shape[0] or not self.matrix.flags.writeable:
+            capacity = max(rows, int(self.matrix.shape[0] * 1.5), 16)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[:len(self.ids)] = self.matrix[:len(self.ids)]
+            self.matrix = grown
+        if rows > self.index.get_max_elements():
+            self.index.resize_index(max(rows, int(self.index.get_max_elements() * 1.5)))
+
+    def upsert(self, ids: List[str], embeddings):
+        if not len(ids):
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            new_ids = [cid for cid in ids if cid not in self.labels]
+            reused = min(len(new_ids), len(self.free_labels))
+            self._ensure_capacity(len(self.ids) + len(new_ids) - reused)
+
+            labels = []
+            for cid in ids:
+                label = self.labels.get(cid)
+                if label is None:
+                    if self.free_labels:
+                        label = self.free_labels.pop()
+                        self.ids[label] = cid
+                        # Revive the tombstone; add_items below overwrites its vector in place
+                        self.index.unmark_deleted(label)
+                    else:
+                        label = len(self.ids)
+                        self.ids.append(cid)
+                    self.labels[cid] = label
+                labels.append(label)
+
+            labels = np.asarray(labels, dtype=np.int64)
+            self.matrix[labels] = embeddings
+            # Labels are always chosen here, never by hnswlib (replace_deleted would let it
+            # put an element into any tombstoned slot behind the id map's back)
+            self.index.add_items(embeddings, labels, replace_deleted=False)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for cid in ids:
+                label = self.labels.pop(cid, None)
+                if label is None:
+                    continue
+                self.index.mark_deleted(label)
+                self.ids[label] = None
+                self.free_labels.append(label)
+
+    # --- Reads ---
+
+    def __len__(self):
+        return len(self.labels)
+
+    def exact_index(self, dtype: str = EXACT_SEARCH_DTYPE) -> "ExactVectorIndex":
+        """Copies the live rows into an ExactVectorIndex (no round trip to Chroma)."""
+        with self._lock:
+            live = [label for label, cid in enumerate(self.ids) if cid is not None]
+            return ExactVectorIndex.build([self.ids[label] for label in live], self.matrix[live], dtype)
+
+    def search(self, query_embedding, k: int) -> Tuple[List[str], List[float]]:
+        """Approximate top-k. Returns (chunk ids, cosine distances), nearest first."""
+        with self._lock:
+            k = min(k, len(self.labels))
+            if k <= 0:
+                return [], []
+            if self.index.ef < k:
+                self.index.set_ef(k)
+            labels, distances = self.index.knn_query(np.asarray(query_embedding, dtype=np.float32), k=k)
+            return [self.ids[label] for label in labels[0].tolist()], distances[0].tolist()
+
+
+class ExactVectorIndex:
+    """
+    Brute-force cosine search: one matrix-vector product over a contiguous matrix of
+    normalized embeddings plus argpartition for the top-k. Exact (recall 1.0 by
+    construction), so it doubles as the ground truth for measuring ANN recall.
+
+    Immutable like BM25Index: `updated` returns a new index, so it can live in the
+    retrieval snapshot and be read without locks.
+    """
+
+    def __init__(self, ids: List[str], matrix: np.ndarray):
+        self.ids = ids
+        self.positions = {cid: i for i, cid in enumerate(ids)}
+        self.matrix = np.ascontiguousarray(matrix)
+        self.dim = self.matrix.shape[1]
+
+    @classmethod
+    def build(cls, ids: Sequence[str], embeddings, dtype: str = EXACT_SEARCH_DTYPE) -> "ExactVectorIndex":
+        return cls(list(ids), np.asarray(embeddings, dtype=dtype))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def updated(self, add_ids: Sequence[str], add_embeddings, remove_ids: Sequence[str]) -> "ExactVectorIndex":
+        """New index with `remove_ids` dropped and `add_ids` inserted (existing ids are replaced)."""
+        drop = set(remove_ids) | set(add_ids)
+        keep = np.fromiter((cid not in drop for cid in self.ids), dtype=bool, count=len(self.ids))
+        ids = [cid for cid, k in zip(self.ids, keep) if k] + list(add_ids)
+        add = np.asarray(add_embeddings, dtype=self.matrix.dtype).reshape(-1, self.dim)
+        return ExactVectorIndex(ids, np.concatenate([self.matrix[keep], add]))
+
+    def scores(self, query_embedding) -> np.ndarray:
+        """Cosine similarity of the query against every row."""
+        q = np.asarray(query_embedding, dtype=np.float32)
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ q
+        out = np.empty(len(self.ids), dtype=np.float32)
+        buf = np.empty((min(EXACT_SEARCH_BLOCK, len(self.ids)), self.dim), dtype=np.float32)
+        for start in range(0, len(self.ids), EXACT_SEARCH_BLOCK):
+            block = self.matrix[start:start + EXACT_SEARCH_BLOCK]
+            rows = buf[:len(block)]
+            rows[...] = block
+            np.dot(rows, q, out=out[start:start + len(block)])
+        return out
+
+    def search(self, query_embedding, k: int) -> Tuple[List[str], List[float]]:
+        """Exact top-k. Returns (chunk ids, cosine distances), nearest first."""
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return [], []
+        sims = self.scores(query_embedding)
+        top = np.argpartition(-sims, k - 1)[:k] if len(sims) > k else np.arange(len(sims))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [self.ids[i] for i in top.tolist()], (1.0 - sims[top]).tolist()
@@ -1,33 +1,41 @@
 import os
 import sys
+import shutil
 
 # Ensure backend dir is in path
 sys.path.append(os.getcwd())
 
-from app.rag.engine import ingest_docs, get_collection
+from app.rag.engine import ingest_docs, get_collection, MANIFEST_PATH, HNSW_INDEX_PATH, BM25_INDEX_PATH
 
-def reingest():
+def reingest(full: bool = False):
     print("--- Starting Re-ingestion ---")
-    
-    # 1. Clear old data? 
-    # Optional: col = get_collection(); col.delete(where={}) 
-    # upsert handles overwriting by ID, but for clean chunks we should delete everything first
-    try:
-        col = get_collection()
-        print(f"Clearing collection '{col.name}'...")
-        # Since we use doc_id + index, and index might change with new chunking, 
-        # delete_all is safer.
-        all_docs = col.get()
-        if all_docs['ids']:
-            col.delete(ids=all_docs['ids'])
-            print(f"Deleted {len(all_docs['ids'])} old chunks.")
-    except Exception as e:
-        print(f"Could not clear collection (might be empty): {e}")
 
-    # 2. Ingest with new 300-word chunk size
+    # Incremental ingestion (manifest-based) only touches new/changed/deleted files
+    # and removes stale chunks itself. --full wipes everything, which is only needed
+    # for collections created before the ingest manifest existed.
+    if full:
+        try:
+            col = get_collection()
+            print(f"Clearing collection '{col.name}'...")
+            all_docs = col.get()
+            if all_docs['ids']:
+                col.delete(ids=all_docs['ids'])
+                print(f"Deleted {len(all_docs['ids'])} old chunks.")
+        except Exception as e:
+            print(f"Could not clear collection (might be empty): {e}")
+        if os.path.exists(MANIFEST_PATH):
+            os.remove(MANIFEST_PATH)
+            print("Removed ingest manifest.")
+        if os.path.exists(HNSW_INDEX_PATH):
+            shutil.rmtree(HNSW_INDEX_PATH)
+            print("Removed HNSW index.")
+        if os.path.exists(BM25_INDEX_PATH):
+            shutil.rmtree(BM25_INDEX_PATH)
+            print("Removed BM25 index.")
+
     print("Ingesting documents...")
-    stats = ingest_docs()
+    stats = ingest_docs(force=full)
     print(f"SUCCESS: {stats}")
 
 if __name__ == "__main__":
-    reingest()
+    reingest(full="--full" in sys.argv)
@@ -0,0 +1,127 @@
+"""
+Embedding backend benchmark: throughput, query latency and recall parity vs PyTorch.
+
+Run from backend/:
+    python scripts/bench_embeddings.py --backends torch,onnx,onnx-int8 --limit 2000 --k 5
+
+The corpus is the chunked documents under data/ (same loader/chunker as ingestion).
+Parity is measured as recall@k of each backend's exact top-k against the torch top-k
+for the eval questions, plus the mean cosine between the two backends' chunk vectors.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Ensure backend dir is in path
+sys.path.append(os.getcwd())
+
+from app.rag.engine import load_docs, chunk_text, EMBEDDING_MODEL_ID
+from app.rag.embeddings import load_embedding_model
+from scripts.bench_retrieval import RESULTS_DIR
+
+EVAL_FILE = "data/eval.json"
+
+CONFIGS = {
+    "torch": ("torch", False),
+    "onnx": ("onnx", False),
+    "onnx-int8": ("onnx", True),
+}
+
+def load_corpus(limit: int):
+    chunks = [c for doc in load_docs() for c in chunk_text(doc.get("body", ""))]
+    return chunks[:limit] if limit else chunks
+
+def load_queries():
+    with open(EVAL_FILE, "r") as f:
+        return [entry["question"] for entry in json.load(f)]
+
+def top_k(query_emb: np.ndarray, corpus_emb: np.ndarray, k: int) -> np.ndarray:
+    scores = query_emb @ corpus_emb.T
+    k = min(k, corpus_emb.shape[0])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(part, np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1), axis=1)
+
+def run_backend(name: str, chunks, queries, batch_size: int):
+    backend, quantize = CONFIGS[name]
+    t0 = time.perf_counter()
+    model = load_embedding_model(EMBEDDING_MODEL_ID, backend=backend, quantize=quantize)
+    load_seconds = time.perf_counter() - t0
+
+    # Warm up before timing
+    model.encode(chunks[:batch_size], normalize_embeddings=True, batch_size=batch_size)
+
+    t0 = time.perf_counter()
+    corpus_emb = model.encode(chunks, normalize_embeddings=True, batch_size=batch_size)
+    encode_seconds = time.perf_counter() - t0
+
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        model.encode([q], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    query_emb = model.encode(queries, normalize_embeddings=True)
+
+    result = {
+        "backend": backend,
+        "quantized": quantize,
+        "load_seconds": round(load_seconds, 2),
+        "chunks": len(chunks),
+        "chunks_per_second": round(len(chunks) / encode_seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+    return result, np.asarray(corpus_emb, dtype=np.float32), np.asarray(query_emb, dtype=np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--limit", type=int, default=2000, help="max chunks to encode (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "bench_embeddings.json"))
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.backends.split(",") if n.strip()]
+    # torch is the reference for parity, so always run it first
+    if "torch" in names:
+        names.remove("torch")
+    names.insert(0, "torch")
+
+    chunks = load_corpus(args.limit)
+    queries = load_queries()
+    print(f"=== Embedding benchmark: {len(chunks)} chunks, {len(queries)} queries ===\n")
+
+    results = {}
+    ref_corpus = ref_top = None
+    for name in names:
+        try:
+            result, corpus_emb, query_emb = run_backend(name, chunks, queries, args.batch_size)
+        except Exception as e:
+            print(f"[{name}] SKIPPED: {e}")
+            results[name] = {"error": str(e)}
+            continue
+
+        top = top_k(query_emb, corpus_emb, args.k)
+        if name == "torch":
+            ref_corpus, ref_top = corpus_emb, top
+        elif ref_top is not None:
+            overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(top.tolist(), ref_top.tolist())]
+            result[f"recall@{args.k}_vs_torch"] = round(float(np.mean(overlap)), 4)
+            result["mean_cosine_vs_torch"] = round(float(np.mean(np.sum(corpus_emb * ref_corpus, axis=1))), 4)
+            result["speedup_vs_torch"] = round(result["chunks_per_second"] / results["torch"]["chunks_per_second"], 2)
+        else:
+            # No torch reference (failed or unavailable) - throughput only
+            result["parity"] = "skipped: torch reference unavailable"
+        results[name] = result
+        print(f"[{name}] {json.dumps(result)}")
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump({"model": EMBEDDING_MODEL_ID, "k": args.k, "results": results}, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+In-process retrieval benchmark: per-stage latency, QPS under concurrency and memory.
+
+Run from backend/:
+    python scripts/bench_retrieval.py --threads 1,4,16 --requests 400 --out bench_results/base.json
+    python scripts/bench_retrieval.py --baseline bench_results/base.json --max-regression 0.2
+
+The corpus is fixed: documents under data/ are ingested once into a separate store
+(data/bench_db, reused on later runs) so the live collection is never touched, and
+the corpus fingerprint (chunk count + hash of chunk ids) is written to the output so
+two runs are only compared on the same corpus. Queries are the questions in
+data/eval.json. The query embedding cache is disabled unless --with-cache, so every
+query pays for its embedding like a first-time question would.
+
+Stages come from the tracing spans (embed, vector_query, bm25_score, fusion, fetch).
+With --baseline the p50/p95 latencies and QPS are compared against an earlier run and
+the script exits with status 1 if any got worse by more than --max-regression.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import platform
+import resource
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Ensure backend dir is in path
+sys.path.append(os.getcwd())
+
+from app.rag import engine
+from app.core.tracing import start_trace, finish_trace
+
+EVAL_FILE = "data/eval.json"
+# Reports go here by default (gitignored); pass --out to keep one elsewhere
+RESULTS_DIR = "bench_results"
+
+MODES = {
+    "vector": lambda q, k: engine.retrieve_docs(q, k),
+    "bm25": lambda q, k: engine.bm25_retrieve_docs(q, k),
+    "hybrid": lambda q, k: engine.hybrid_retrieve_docs(q, k),
+}
+
+def use_bench_store(db_path: str):
+    """Points the engine at a dedicated store so benchmarking never touches the live collection."""
+    engine.DB_PATH = db_path
+    engine.MANIFEST_PATH = os.path.join(db_path, "ingest_manifest.json")
+    engine.BM25_INDEX_PATH = os.path.join(db_path, "bm25_index")
+    engine.HNSW_INDEX_PATH = os.path.join(db_path, "hnsw_index")
+
+def prepare_corpus() -> dict:
+    stats = engine.ingest_docs()
+    engine.init_bm25()
+    engine.init_vector_store()
+    engine.init_exact_index()
+    engine.warmup_retrieval()
+    ids = sorted(engine.get_collection().get(include=[])["ids"])
+    return {
+        "chunks": len(ids),
+        "fingerprint": hashlib.sha256("\n".join(ids).encode()).hexdigest()[:16],
+        "ingested_now": stats["chunks_embedded"]
+    }
+
+def load_queries():
+    with open(EVAL_FILE, "r") as f:
+        return [entry["question"] for entry in json.load(f)]
+
+def distribution(values_ms) -> dict:
+    if not values_ms:
+        return {}
+    values = np.asarray(values_ms)
+    return {
+        "n": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+def timed_query(fn, query: str, k: int):
+    """Runs one query under a fresh trace. Returns (total ms, {stage: ms})."""
+    trace = start_trace(str(uuid.uuid4()), "bench")
+    start = time.perf_counter()
+    fn(query, k)
+    total = (time.perf_counter() - start) * 1000
+    finish_trace(trace, "ok")
+    stages = {}
+    for name, s, e in trace.spans:
+        stages[name] = stages.get(name, 0.0) + (e - s) * 1000
+    return total, stages
+
+def bench_latency(fn, queries, k: int, repeats: int) -> dict:
+    totals, stages = [], {}
+    for _ in range(repeats):
+        for q in queries:
+            total, spans = timed_query(fn, q, k)
+            totals.append(total)
+            for name, ms in spans.items():
+                stages.setdefault(name, []).append(ms)
+    return {"total": distribution(totals), "stages": {name: distribution(v) for name, v in sorted(stages.items())}}
+
+def bench_throughput(fn, queries, k: int, threads: int, requests: int) -> dict:
+    work = [queries[i % len(queries)] for i in range(requests)]
+    latencies = []
+
+    def one(q):
+        start = time.perf_counter()
+        fn(q, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(one, work))
+        elapsed = time.perf_counter() - start
+    return {"threads": threads, "requests": requests, "qps": round(requests / elapsed, 1), **distribution(latencies)}
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return None
+
+def memory_report() -> dict:
+    snapshot = engine.get_snapshot()
+    index_bytes = {}
+    if snapshot.bm25 is not None:
+        index_bytes["bm25"] = sum(int(getattr(snapshot.bm25, name).nbytes) for name in snapshot.bm25._ARRAYS)
+    if snapshot.exact is not None:
+        index_bytes["exact"] = int(snapshot.exact.matrix.nbytes)
+    if snapshot.vectors is not None:
+        index_bytes["hnsw_matrix"] = int(snapshot.vectors.matrix.nbytes)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    return {"rss_mb": rss_mb(), "peak_rss_mb": round(peak_mb, 1), "index_bytes": index_bytes}
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list:
+    """Lists (metric, baseline, current, change) for every metric that regressed beyond the limit."""
+    if baseline.get("corpus", {}).get("fingerprint") != result["corpus"]["fingerprint"]:
+        print("WARNING: baseline was run on a different corpus - comparison is not meaningful")
+    regressions = []
+    for mode, current in result["modes"].items():
+        old = baseline.get("modes", {}).get(mode)
+        if not old:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            a, b = old["latency"]["total"].get(key), current["latency"]["total"].get(key)
+            if a and b:
+                change = (b - a) / a
+                print(f"  {mode:7s} latency {key}: {a:9.3f} -> {b:9.3f} ({change:+.1%})")
+                if change > max_regression:
+                    regressions.append((f"{mode}.{key}", a, b, change))
+        old_qps = {t["threads"]: t["qps"] for t in old.get("throughput", [])}
+        for t in current["throughput"]:
+            a, b = old_qps.get(t["threads"]), t["qps"]
+            if a:
+                change = (b - a) / a
+                print(f"  {mode:7s} qps @{t['threads']:<2d} threads: {a:9.1f} -> {b:9.1f} ({change:+.1%})")
+                if -change > max_regression:
+                    regressions.append((f"{mode}.qps@{t['threads']}", a, b, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(engine.DATA_DIR, "bench_db"))
+    parser.add_argument("--modes", default="vector,bm25,hybrid")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5, help="passes over the queries for latency")
+    parser.add_argument("--threads", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=400, help="queries per concurrency level")
+    parser.add_argument("--with-cache", action="store_true", help="keep the query embedding cache on")
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "bench_retrieval.json"))
+    parser.add_argument("--baseline", help="earlier output to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    use_bench_store(args.db)
+    if not args.with_cache:
+        engine._query_embedding_cache.maxsize = 0
+    rss_start = rss_mb()
+
+    corpus = prepare_corpus()
+    if not corpus["chunks"]:
+        print(f"No chunks in {args.db} - nothing to benchmark (are there documents under {engine.DATA_DIR}?)")
+        sys.exit(1)
+    queries = load_queries()
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    threads = [int(t) for t in args.threads.split(",") if t.strip()]
+    print(f"=== Retrieval benchmark: {corpus['chunks']} chunks ({corpus['fingerprint']}), "
+          f"{len(queries)} queries, k={args.k} ===\n")
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "vector_backend": engine.VECTOR_BACKEND,
+            "vector_search_mode": engine.VECTOR_SEARCH_MODE,
+            "embedding_model": engine.EMBEDDING_MODEL_KEY,
+            "query_cache": args.with_cache,
+            "k": args.k
+        },
+        "corpus": corpus,
+        "modes": {}
+    }
+
+    for mode in modes:
+        fn = MODES[mode]
+        latency = bench_latency(fn, queries, args.k, args.repeats)
+        throughput = [bench_throughput(fn, queries, args.k, n, args.requests) for n in threads]
+        result["modes"][mode] = {"latency": latency, "throughput": throughput}
+        total = latency["total"]
+        print(f"[{mode}] p50={total['p50_ms']}ms p95={total['p95_ms']}ms p99={total['p99_ms']}ms")
+        for name, d in latency["stages"].items():
+            print(f"    {name:14s} p50={d['p50_ms']}ms p95={d['p95_ms']}ms")
+        print("    " + "  ".join(f"{t['threads']}t={t['qps']}qps" for t in throughput))
+
+    result["memory"] = dict(memory_report(), rss_start_mb=rss_start)
+    print(f"\nMemory: {json.dumps(result['memory'])}")
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline} (commit {baseline.get('meta', {}).get('commit')}):")
+        regressions = compare(result, baseline, args.max_regression)
+        if regressions:
+            for metric, a, b, change in regressions:
+                print(f"REGRESSION {metric}: {a} -> {b} ({change:+.1%})")
+            sys.exit(1)
+        print("No regressions beyond the limit.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Offline retrieval quality harness: recall@k, MRR and nDCG@k for the vector, BM25 and
+hybrid paths. No LLM and no network (the embedding model must already be cached).
+
+Run from backend/:
+    python scripts/eval_retrieval.py --k 1,3,5 --out bench_results/eval_base.json
+    python scripts/eval_retrieval.py --min hybrid.recall@5=0.9 --min mrr=0.6
+    python scripts/eval_retrieval.py --baseline bench_results/eval_base.json --max-drop 0.02
+
+Labels are in data/retrieval_eval.json: a list of {"question", "relevant_docs"} and
+optionally "relevant_chunks" (chunk ids such as "1_0"). Doc ids are the ingestion ids -
+the "id" of JSON docs under data/docs, the file name for PDFs. Entries with chunk labels
+are judged on chunks, the rest on docs (a doc counts at the rank of its first chunk).
+Entries whose labelled docs are not in the corpus are skipped and reported.
+
+Retrieval runs against the same fixed store as scripts/bench_retrieval.py (--db), so a
+change can be gated on quality here and on latency there. The script exits with status 1
+if any --min threshold is not met or any metric dropped by more than --max-drop vs
+--baseline.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import numpy as np
+
+# Ensure backend dir is in path
+sys.path.append(os.getcwd())
+
+from app.rag import engine
+from scripts.bench_retrieval import use_bench_store, prepare_corpus, RESULTS_DIR
+
+LABELS_FILE = "data/retrieval_eval.json"
+
+MODES = {
+    "vector": lambda q, k: engine.retrieve_docs(q, k),
+    "exact": lambda q, k: engine.retrieve_docs(q, k, exact=True),
+    "bm25": lambda q, k: engine.bm25_retrieve_docs(q, k),
+    "hybrid": lambda q, k: engine.hybrid_retrieve_docs(q, k),
+}
+
+def corpus_doc_ids() -> set:
+    metadatas = engine.get_collection().get(include=["metadatas"])["metadatas"]
+    return {str(m.get("doc_id")) for m in metadatas if m}
+
+def ranked_ids(hits, by_chunk: bool) -> list:
+    """Ranked chunk ids, or ranked doc ids with each doc kept at its first chunk's rank."""
+    if by_chunk:
+        return [hit["id"] for hit in hits]
+    docs = []
+    for hit in hits:
+        doc_id = str(hit["metadata"].get("doc_id"))
+        if doc_id not in docs:
+            docs.append(doc_id)
+    return docs
+
+def recall_at(ranked: list, relevant: set, k: int) -> float:
+    return len(relevant.intersection(ranked[:k])) / len(relevant)
+
+def reciprocal_rank(ranked: list, relevant: set) -> float:
+    for rank, item in enumerate(ranked, 1):
+        if item in relevant:
+            return 1.0 / rank
+    return 0.0
+
+def ndcg_at(ranked: list, relevant: set, k: int) -> float:
+    """Binary-gain nDCG@k."""
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, item in enumerate(ranked[:k], 1) if item in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal
+
+def evaluate(fn, entries, ks, depth: int) -> dict:
+    per_query = []
+    latencies = []
+    for entry in entries:
+        by_chunk = bool(entry.get("relevant_chunks"))
+        relevant = set(entry["relevant_chunks"] if by_chunk else map(str, entry["relevant_docs"]))
+        start = time.perf_counter()
+        hits = fn(entry["question"], depth)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ranked = ranked_ids(hits, by_chunk)
+        row = {"question": entry["question"], "retrieved": ranked[:max(ks)], "rr": reciprocal_rank(ranked, relevant)}
+        for k in ks:
+            row[f"recall@{k}"] = recall_at(ranked, relevant, k)
+            row[f"ndcg@{k}"] = ndcg_at(ranked, relevant, k)
+        per_query.append(row)
+
+    metrics = {"mrr": float(np.mean([r["rr"] for r in per_query]))}
+    for k in ks:
+        metrics[f"recall@{k}"] = float(np.mean([r[f"recall@{k}"] for r in per_query]))
+        metrics[f"ndcg@{k}"] = float(np.mean([r[f"ndcg@{k}"] for r in per_query]))
+    return {
+        "metrics": {name: round(value, 4) for name, value in metrics.items()},
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3)
+        },
+        "queries": per_query
+    }
+
+def parse_gate(spec: str):
+    """'hybrid.recall@5=0.9' -> ('hybrid', 'recall@5', 0.9); without a mode it applies to every mode."""
+    name, _, value = spec.partition("=")
+    mode, _, metric = name.rpartition(".")
+    return mode or None, metric, float(value)
+
+def check_gates(result: dict, gates, baseline: dict, max_drop: float) -> list:
+    failures = []
+    for mode, metric, minimum in gates:
+        for name, data in result["modes"].items():
+            if mode not in (None, name):
+                continue
+            value = data["metrics"].get(metric)
+            if value is None:
+                failures.append(f"{name}.{metric}: unknown metric")
+            elif value < minimum:
+                failures.append(f"{name}.{metric} = {value} < {minimum}")
+    if baseline:
+        for name, data in result["modes"].items():
+            old = baseline.get("modes", {}).get(name, {}).get("metrics", {})
+            for metric, value in data["metrics"].items():
+                if metric in old and old[metric] - value > max_drop:
+                    failures.append(f"{name}.{metric} dropped {old[metric]} -> {value}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.path.join(engine.DATA_DIR, "bench_db"))
+    parser.add_argument("--labels", default=LABELS_FILE)
+    parser.add_argument("--modes", default="vector,bm25,hybrid", help=f"any of {','.join(MODES)}")
+    parser.add_argument("--k", default="1,3,5", help="cutoffs for recall@k and nDCG@k")
+    parser.add_argument("--depth", type=int, default=10, help="chunks retrieved per query")
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "eval_retrieval.json"))
+    parser.add_argument("--min", action="append", default=[], metavar="[MODE.]METRIC=VALUE",
+                        help="fail if a metric is below VALUE (repeatable)")
+    parser.add_argument("--baseline", help="earlier output to compare against")
+    parser.add_argument("--max-drop", type=float, default=0.0, help="allowed absolute drop vs --baseline")
+    args = parser.parse_args()
+
+    ks = sorted({int(k) for k in args.k.split(",") if k.strip()})
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    gates = [parse_gate(spec) for spec in args.min]
+
+    use_bench_store(args.db)
+    corpus = prepare_corpus()
+    docs = corpus_doc_ids()
+
+    with open(args.labels, "r") as f:
+        labels = json.load(f)
+    entries, skipped = [], []
+    for entry in labels:
+        wanted = {str(d) for d in entry.get("relevant_docs", [])}
+        wanted.update(c.rsplit("_", 1)[0] for c in entry.get("relevant_chunks", []))
+        (entries if wanted and wanted <= docs else skipped).append(entry)
+    if not entries:
+        print(f"None of the {len(labels)} labelled queries match documents in {args.db}")
+        sys.exit(1)
+
+    print(f"=== Retrieval quality: {len(entries)} queries ({len(skipped)} skipped, docs not in corpus), "
+          f"{corpus['chunks']} chunks ({corpus['fingerprint']}) ===\n")
+
+    result = {
+        "meta": {
+            "labels": args.labels,
+            "depth": args.depth,
+            "embedding_model": engine.EMBEDDING_MODEL_KEY,
+            "vector_backend": engine.VECTOR_BACKEND,
+            "vector_search_mode": engine.VECTOR_SEARCH_MODE
+        },
+        "corpus": corpus,
+        "skipped": [entry["question"] for entry in skipped],
+        "modes": {}
+    }
+    names = ["mrr"] + [f"{m}@{k}" for m in ("recall", "ndcg") for k in ks]
+    print(f"{'mode':8s} " + " ".join(f"{n:>10s}" for n in names) + f" {'p95 ms':>9s}")
+    for mode in modes:
+        data = evaluate(MODES[mode], entries, ks, max(args.depth, max(ks)))
+        result["modes"][mode] = data
+        print(f"{mode:8s} " + " ".join(f"{data['metrics'][n]:10.4f}" for n in names) + f" {data['latency_ms']['p95']:9.2f}")
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("corpus", {}).get("fingerprint") != corpus["fingerprint"]:
+            print("WARNING: baseline was run on a different corpus - comparison is not meaningful")
+    failures = check_gates(result, gates, baseline, args.max_drop)
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    if gates or baseline:
+        print("All quality gates passed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Minimal OpenAI-compatible chat completions server for load-testing the LLM client layer
+without spending router quota. Standard library only.
+
+Run from backend/:
+    python scripts/llm_stub_server.py --port 8100 --latency 0.5 --token-delay 0.02 --error-rate 0.1
+
+Then start the API with:
+    LLM_BASE_URL=http://127.0.0.1:8100/v1/ HUGGINGFACE_API_KEY=stub uvicorn app.main:app
+
+--error-rate answers that fraction of requests with 429 (with Retry-After) or 503, so
+retries/backoff show up in /rag/metrics under components.llm. --max-concurrent makes the
+stub itself answer 429 when more requests than that are open at once.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = ("Based on the provided context, this is a stub answer generated locally "
+          "for load testing. It streams one word at a time.")
+
+class Stats:
+    lock = threading.Lock()
+    open_requests = 0
+    total = 0
+    errors = 0
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-stub-{random.getrandbits(32):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())}
+    }
+
+def chunk(model: str, content: str = None, finish: str = None) -> dict:
+    delta = {"content": content} if content is not None else {}
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]
+    }
+
+def make_handler(args):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real router
+
+        def log_message(self, fmt, *a):
+            if args.verbose:
+                super().log_message(fmt, *a)
+
+        def send_json(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            with Stats.lock:
+                Stats.open_requests += 1
+                Stats.total += 1
+                overloaded = args.max_concurrent and Stats.open_requests > args.max_concurrent
+            try:
+                if overloaded or random.random() < args.error_rate:
+                    with Stats.lock:
+                        Stats.errors += 1
+                    if overloaded or random.random() < 0.5:
+                        self.send_json(429, {"error": {"message": "Rate limited (stub)"}}, {"Retry-After": "1"})
+                    else:
+                        self.send_json(503, {"error": {"message": "Unavailable (stub)"}})
+                    return
+
+                time.sleep(args.latency)
+                model = body.get("model", "stub")
+                if not body.get("stream"):
+                    self.send_json(200, completion(model, ANSWER))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = [chunk(model, word + " ") for word in ANSWER.split()] + [chunk(model, finish="stop")]
+                for event in events:
+                    self.write_chunk(f"data: {json.dumps(event)}\n\n")
+                    time.sleep(args.token_delay)
+                self.write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            finally:
+                with Stats.lock:
+                    Stats.open_requests -= 1
+
+        def write_chunk(self, text: str):
+            data = text.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self.send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+            elif self.path == "/stats":
+                with Stats.lock:
+                    self.send_json(200, {"open": Stats.open_requests, "total": Stats.total, "errors": Stats.errors})
+            else:
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 429/503")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="answer 429 above this many open requests")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"LLM stub listening on http://{args.host}:{args.port}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
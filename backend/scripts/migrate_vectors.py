@@ -0,0 +1,56 @@
+"""
+Builds the in-process HNSW index from the embeddings already stored in Chroma.
+
+Run from backend/:
+    python scripts/migrate_vectors.py --m 16 --ef-construction 200 --ef 64 --check 20
+
+No re-embedding happens: vectors are paged out of the collection as stored. The index
+is written to data/chroma_db/hnsw_index; start the API with VECTOR_BACKEND=hnsw to use
+it. --check N measures HNSW recall@10 on N sampled stored vectors against exact search.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# Ensure backend dir is in path
+sys.path.append(os.getcwd())
+
+from app.rag.engine import build_vector_store, get_collection, HNSW_INDEX_PATH
+
+def check_recall(store, n: int, k: int = 10) -> float:
+    # Brute force over the same matrix is the ground truth
+    exact = store.exact_index()
+    sample = get_collection().get(include=["embeddings"], limit=n)
+    overlaps = []
+    for embedding in sample["embeddings"]:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        expected, _ = exact.search(embedding, k)
+        got, _ = store.search(embedding, k)
+        overlaps.append(len(set(got) & set(expected)) / max(len(expected), 1))
+    return float(np.mean(overlaps)) if overlaps else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=HNSW_INDEX_PATH)
+    parser.add_argument("--m", type=int, default=None, help="HNSW graph degree (default HNSW_M)")
+    parser.add_argument("--ef-construction", type=int, default=None, help="default HNSW_EF_CONSTRUCTION")
+    parser.add_argument("--ef", type=int, default=None, help="query-time ef (default HNSW_EF)")
+    parser.add_argument("--check", type=int, default=0, help="sample size for a recall@10 check vs exact search")
+    args = parser.parse_args()
+
+    params = {name: value for name, value in
+              (("m", args.m), ("ef_construction", args.ef_construction), ("ef", args.ef)) if value is not None}
+
+    print(f"--- Migrating {get_collection().count()} vectors from Chroma to {args.path} ---")
+    start = time.perf_counter()
+    store = build_vector_store(args.path, **params)
+    print(f"SUCCESS: {len(store)} vectors indexed in {time.perf_counter() - start:.1f}s "
+          f"(M={store.m}, ef_construction={store.ef_construction}, ef={store.ef})")
+
+    if args.check:
+        print(f"HNSW recall@10 vs exact search on {args.check} stored vectors: {check_recall(store, args.check):.3f}")
+
+if __name__ == "__main__":
+    main()
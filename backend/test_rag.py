@@ -21,11 +21,23 @@ def test_ingest():
     # This might take time if model is downloading
     start = time.time()
     print("Sending ingest request (this triggers model download on server)...")
-    r = requests.post(f"{BASE_URL}/rag/ingest", timeout=300) 
-    print(f"Ingest response ({time.time()-start:.2f}s): {r.text}")
-    assert r.status_code == 200, f"Ingest failed: {r.text}"
-    stats = r.json().get("stats", {})
-    assert stats.get("doc_count", 0) > 0, "No docs ingested"
+    r = requests.post(f"{BASE_URL}/rag/ingest", timeout=30)
+    assert r.status_code == 202, f"Ingest failed: {r.text}"
+    job_id = r.json()["job_id"]
+
+    # Ingestion runs in the background - poll the job until it finishes
+    while True:
+        job = requests.get(f"{BASE_URL}/rag/ingest/{job_id}", timeout=30).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        print(f"  ... {job['status']} {job.get('progress')} ETA={job.get('eta_seconds')}s")
+        assert time.time() - start < 600, "Ingest job timed out"
+        time.sleep(2)
+    print(f"Ingest job ({time.time()-start:.2f}s): {job}")
+    assert job["status"] == "completed", f"Ingest failed: {job.get('error')}"
+    stats = job["result"]
+    # Incremental ingest: unchanged files are skipped rather than re-ingested
+    assert stats.get("doc_count", 0) + len(stats.get("files_skipped", [])) > 0, "No docs ingested"
 
 def test_retrieve():
     # Query: "FastAPI" (should match doc1)
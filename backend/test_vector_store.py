@@ -0,0 +1,57 @@
+import os
+import tempfile
+import numpy as np
+
+from app.rag.vector_store import HnswVectorStore
+
+DIM = 16
+
+def run_test(name, func):
+    print(f"Running {name}...")
+    try:
+        func()
+        print(f"✅ {name} PASSED")
+    except Exception as e:
+        print(f"❌ {name} FAILED: {e}")
+
+def vectors(n, seed):
+    v = np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def check_search(store, expected_ids):
+    for q in vectors(5, 99):
+        ids, _ = store.search(q, len(expected_ids) + 2)
+        assert None not in ids, f"Search returned a freed label: {ids}"
+        assert len(ids) == len(set(ids)), f"Search returned duplicate ids: {ids}"
+        assert set(ids) == set(expected_ids), f"Expected {sorted(expected_ids)}, got {sorted(ids)}"
+
+def test_delete_readd_search():
+    store = HnswVectorStore.build(os.path.join(tempfile.mkdtemp(), "hnsw"), ["a", "b", "c", "d"], vectors(4, 0))
+    store.delete(["b", "d"])
+    # Re-upsert a live id after deletes, then add new ids that reuse the freed labels
+    store.upsert(["a"], vectors(1, 1))
+    check_search(store, ["a", "c"])
+    store.upsert(["e", "f", "g"], vectors(3, 2))
+    check_search(store, ["a", "c", "e", "f", "g"])
+
+    # Each id must find its own (latest) vector
+    for cid, v in zip(["e", "f", "g"], vectors(3, 2)):
+        ids, distances = store.search(v, 1)
+        assert ids == [cid] and distances[0] < 1e-4, f"{cid} -> {ids} {distances}"
+
+def test_delete_readd_after_reload():
+    path = os.path.join(tempfile.mkdtemp(), "hnsw")
+    store = HnswVectorStore.build(path, ["a", "b", "c"], vectors(3, 0))
+    store.delete(["a"])
+    store.save()
+
+    store = HnswVectorStore.load(path)
+    store.upsert(["a", "c"], vectors(2, 3))
+    store.delete(["b"])
+    store.upsert(["b"], vectors(1, 4))
+    check_search(store, ["a", "b", "c"])
+    assert len(store) == 3
+
+if __name__ == "__main__":
+    run_test("HNSW delete / re-add / search", test_delete_readd_search)
+    run_test("HNSW delete / re-add after reload", test_delete_readd_after_reload)